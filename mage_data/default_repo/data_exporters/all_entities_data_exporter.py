@@ -0,0 +1,17 @@
+from default_repo.utils.pg_load import export_entities
+from default_repo.utils.runtime import parse_flag
+
+if 'data_exporter' not in globals():
+    from mage_ai.data_preparation.decorators import data_exporter
+
+
+@data_exporter
+def export_all_entities_to_postgres(df, *args, **kwargs):
+    logger = kwargs.get('logger')
+
+    if parse_flag(kwargs.get('dry_run')):
+        logger.info(f"[PLAN] Modo dry_run: no se escribe en Postgres.")
+        return
+
+    export_entities(df, logger, kwargs.get('write_mode'), parse_flag(kwargs.get('defer_indexes')),
+                    kwargs.get('writers'))
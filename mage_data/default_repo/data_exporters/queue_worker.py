@@ -0,0 +1,17 @@
+from default_repo.utils.work_queue import run_worker
+
+if 'data_exporter' not in globals():
+    from mage_ai.data_preparation.decorators import data_exporter
+
+
+@data_exporter
+def run_backfill_queue_worker(df, *args, **kwargs):
+    """
+    Procesa tramos de la cola hasta vaciarla. Cada instancia de Mage (o worker
+    externo) que ejecute este bloque reclama tramos distintos.
+    """
+    logger = kwargs.get('logger')
+    status = run_worker(**kwargs)
+    for row in status.itertuples():
+        logger.info(f"[QUEUE-STATUS] {row.entity} | realm {row.realm_id} | {row.state}: "
+                    f"{row.windows} tramos, {row.records} registros")
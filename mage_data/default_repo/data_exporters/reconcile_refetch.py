@@ -0,0 +1,16 @@
+from default_repo.utils.reconcile import refetch_mismatches
+from default_repo.utils.runtime import parse_flag
+
+if 'data_exporter' not in globals():
+    from mage_ai.data_preparation.decorators import data_exporter
+
+
+@data_exporter
+def refetch_mismatched_windows(df, *args, **kwargs):
+    logger = kwargs.get('logger')
+
+    if parse_flag(kwargs.get('dry_run')):
+        logger.info(f"[PLAN] Modo dry_run: solo conciliación, no se re-extraen tramos.")
+        return df
+
+    return refetch_mismatches(df, **kwargs)
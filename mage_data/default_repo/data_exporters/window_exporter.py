@@ -0,0 +1,16 @@
+from default_repo.utils.pg_load import export_entity
+
+if 'data_exporter' not in globals():
+    from mage_ai.data_preparation.decorators import data_exporter
+
+
+@data_exporter
+def export_backfill_window(df, *args, **kwargs):
+    logger = kwargs.get('logger')
+
+    if df is None or df.empty:
+        logger.warning("[VOLUMETRY] Tramo sin registros. Nada que exportar.")
+        return
+
+    entity = df['entity'].iloc[0]
+    export_entity(df.drop(columns=['entity']), entity, logger)
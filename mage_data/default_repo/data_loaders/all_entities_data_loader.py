@@ -0,0 +1,15 @@
+from default_repo.utils.entities import parse_entities
+from default_repo.utils.multi_realm import extract_realms, load_realm_settings, parse_realms
+from default_repo.utils.qbo_extract import extract_entities
+
+if 'data_loader' not in globals():
+    from mage_ai.data_preparation.decorators import data_loader
+
+
+@data_loader
+def load_all_entities_from_quickbooks(*args, **kwargs):
+    entities = parse_entities(kwargs.get('entities'))
+    realms = parse_realms(kwargs.get('realms'))
+    if realms:
+        return extract_realms(load_realm_settings(realms), entities, kwargs.get('realm_workers'), **kwargs)
+    return extract_entities(entities, **kwargs)
@@ -0,0 +1,20 @@
+from default_repo.utils.config import load_qbo_settings
+from default_repo.utils.entities import parse_entities
+from default_repo.utils.multi_realm import parse_realms
+from default_repo.utils.work_queue import enqueue_windows
+
+if 'data_loader' not in globals():
+    from mage_ai.data_preparation.decorators import data_loader
+
+
+@data_loader
+def enqueue_backfill_windows(*args, **kwargs):
+    """
+    Encola los tramos del rango en raw.qb_backfill_queue. Sin `realms` se usa
+    el realm de QBO_REALM_ID. Devuelve el estado de la cola.
+    """
+    entities = parse_entities(kwargs.get('entities'))
+    realm_ids = [realm['realm_id'] for realm in parse_realms(kwargs.get('realms'))]
+    if not realm_ids:
+        realm_ids = [load_qbo_settings()['realm_id']]
+    return enqueue_windows(entities, realm_ids, **kwargs)
@@ -0,0 +1,14 @@
+from default_repo.utils.entities import parse_entities
+from default_repo.utils.reconcile import compare_windows
+
+if 'data_loader' not in globals():
+    from mage_ai.data_preparation.decorators import data_loader
+
+
+@data_loader
+def compare_window_counts(*args, **kwargs):
+    """
+    Compara por tramo el COUNT(*) de QBO con las filas en raw.qb_<entidad>
+    (ver utils/reconcile.py). Devuelve el reporte de tramos.
+    """
+    return compare_windows(parse_entities(kwargs.get('entities')), **kwargs)
@@ -0,0 +1,19 @@
+from default_repo.utils.entities import parse_entities
+from default_repo.utils.qbo_extract import plan_windows
+
+if 'data_loader' not in globals():
+    from mage_ai.data_preparation.decorators import data_loader
+
+
+@data_loader
+def plan_backfill_windows(*args, **kwargs):
+    """
+    Bloque dinámico: cada tramo de la lista genera un bloque hijo en Mage
+    (window_extractor -> window_exporter) que se ejecuta de forma independiente.
+    """
+    windows = plan_windows(parse_entities(kwargs.get('entities')), **kwargs)
+    metadata = [
+        dict(block_uuid=f"{window['entity'].lower()}_{window['window_index']}")
+        for window in windows
+    ]
+    return [windows, metadata]
@@ -0,0 +1,9 @@
+from default_repo.utils.qbo_extract import extract_window
+
+if 'transformer' not in globals():
+    from mage_ai.data_preparation.decorators import transformer
+
+
+@transformer
+def extract_backfill_window(window, *args, **kwargs):
+    return extract_window(window, **kwargs)
@@ -0,0 +1,116 @@
+import threading
+import time
+
+DEFAULT_BREAKER = {
+    'failure_threshold': 8,      # Fallos seguidos (5xx/red) que abren el circuito (> MAX_RETRIES de una consulta)
+    'cool_down': 30.0,           # Espera en abierto antes de la petición de prueba (s)
+    'max_cool_down': 300.0,      # Tope de la espera, que se duplica con cada prueba fallida (s)
+    'max_open_seconds': 1800.0,  # Caída continua tolerada antes de detener la extracción (s)
+}
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """El endpoint lleva más de `max_open_seconds` caído."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de un endpoint de QBO (consultas o tokens).
+
+    Cerrado: las peticiones pasan y se cuentan los fallos seguidos. Abierto:
+    todas las peticiones esperan el cool-down. Medio abierto: pasa una sola
+    petición de prueba; si responde, el circuito se cierra y la extracción
+    sigue donde estaba; si falla, se vuelve a abrir con el doble de espera.
+    Es seguro compartirlo entre hilos que consultan el mismo endpoint.
+    """
+
+    def __init__(self, name, config=None, logger=None):
+        settings = dict(DEFAULT_BREAKER)
+        settings.update(config or {})
+        self.name = name
+        self.failure_threshold = int(settings['failure_threshold'])
+        self.base_cool_down = float(settings['cool_down'])
+        self.max_cool_down = float(settings['max_cool_down'])
+        self.max_open_seconds = float(settings['max_open_seconds'])
+        self.logger = logger
+
+        self.state = CLOSED
+        self.failures = 0
+        self.cool_down = self.base_cool_down
+        self.opened_at = None       # Inicio de la caída (primera apertura)
+        self.retry_at = 0.0         # Fin del cool-down en curso
+        self._probe_until = 0.0     # Fin del plazo de la petición de prueba en curso
+        self._condition = threading.Condition()
+
+    def before_request(self, deadline=None):
+        """
+        Bloquea mientras el circuito está abierto. Al terminar el cool-down deja
+        pasar una sola petición de prueba; las demás esperan su resultado.
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self.state == CLOSED:
+                    return
+                if now - self.opened_at > self.max_open_seconds:
+                    raise CircuitOpenError(f"[CIRCUIT-BREAKER] Endpoint '{self.name}' caído hace "
+                                           f"{now - self.opened_at:.0f}s (máximo: {self.max_open_seconds:.0f}s).")
+                if self.state == OPEN and now >= self.retry_at:
+                    self.state = HALF_OPEN
+                if self.state == HALF_OPEN and now >= self._probe_until:
+                    # Si la prueba no informa su resultado a tiempo, pasa otra
+                    self._probe_until = now + self.cool_down
+                    self._log('info', f"[CIRCUIT-BREAKER] Endpoint '{self.name}' medio abierto: "
+                                      f"enviando petición de prueba.")
+                    return
+
+                wait = (self.retry_at if self.state == OPEN else self._probe_until) - now
+                if deadline is not None:
+                    deadline.check()
+                    remaining = deadline.remaining()
+                    if remaining is not None:
+                        wait = min(wait, remaining)
+                self._condition.wait(max(wait, 0.0))
+
+    def on_success(self):
+        with self._condition:
+            if self.state != CLOSED:
+                self._log('warning', f"[CIRCUIT-BREAKER] Endpoint '{self.name}' recuperado tras "
+                                     f"{time.monotonic() - self.opened_at:.0f}s. Circuito cerrado.")
+            self.state = CLOSED
+            self.failures = 0
+            self.cool_down = self.base_cool_down
+            self.opened_at = None
+            self._probe_until = 0.0
+            self._condition.notify_all()
+
+    def on_failure(self):
+        """Registra un fallo del endpoint. Devuelve True si el circuito quedó abierto."""
+        with self._condition:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                # La prueba falló: se reabre con más espera
+                self.cool_down = min(self.max_cool_down, self.cool_down * 2)
+                self._open(now, f"prueba fallida. Nuevo intento en {self.cool_down:.0f}s")
+            elif self.state == CLOSED:
+                self.failures += 1
+                if self.failures >= self.failure_threshold:
+                    self.opened_at = now
+                    self._open(now, f"{self.failures} fallos seguidos. Extracción en pausa "
+                                    f"{self.cool_down:.0f}s")
+            return self.state != CLOSED
+
+    def _open(self, now, reason):
+        self.state = OPEN
+        self.retry_at = now + self.cool_down
+        self._probe_until = 0.0
+        self._condition.notify_all()
+        self._log('error', f"[CIRCUIT-BREAKER] Endpoint '{self.name}' abierto: {reason}.")
+
+    def _log(self, level, message):
+        if self.logger:
+            getattr(self.logger, level)(message)
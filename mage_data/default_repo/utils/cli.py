@@ -0,0 +1,180 @@
+"""
+Ejecución de backfills fuera de la UI de Mage:
+
+    cd mage_data
+    python -m default_repo.utils.cli run --entities Invoice --start 2024-01-01T00:00:00Z \
+        --end 2024-01-31T23:59:59Z --workers 4 --secrets-file secrets.env
+    python -m default_repo.utils.cli worker --env-secrets
+    python -m default_repo.utils.cli flatten --entities Invoice --env-secrets
+    python -m default_repo.utils.cli reconcile --start 2024-01-01T00:00:00Z --end 2024-12-31T23:59:59Z
+
+`run` reparte los tramos en un pool de procesos (cada proceso con su cliente
+QBO y su conexión a Postgres); `worker` procesa la cola de utils/work_queue.py;
+`flatten` reconstruye las tablas planas de utils/flatten.py desde RAW;
+`reconcile` compara conteos por tramo y re-extrae los que difieren (utils/reconcile.py).
+"""
+import argparse
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from default_repo.utils import secrets
+from default_repo.utils.config import load_db_params, load_qbo_settings
+from default_repo.utils.dead_letter import record_dead_letters
+from default_repo.utils.entities import get_entity_config, parse_entities
+from default_repo.utils.flatten import flatten_entity
+from default_repo.utils.pg_load import (SCHEMA_NAME, create_db_pool, export_entity, export_entities,
+                                        get_db_connection_with_retry)
+from default_repo.utils.qbo_extract import QboClient, extract_entities, extract_window, plan_windows
+from default_repo.utils.reconcile import MATCH, REPAIRED, compare_windows, refetch_mismatches
+from default_repo.utils.work_queue import run_worker
+
+LOG_FORMAT = '%(asctime)s %(processName)s %(levelname)s %(message)s'
+
+# Estado de cada proceso del pool
+_worker = {}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m default_repo.utils.cli',
+                                     description='Backfill de QuickBooks Online a Postgres (capa raw).')
+    parser.add_argument('--secrets-file', help='Archivo JSON o .env con los secretos (QBO_*, POSTGRES_*)')
+    parser.add_argument('--env-secrets', nargs='?', const='', metavar='PREFIJO',
+                        help='Leer secretos de variables de entorno (opcionalmente con prefijo)')
+    parser.add_argument('--log-level', default='INFO')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Extrae y carga un rango de fechas')
+    run.add_argument('--entities', help='Entidades separadas por coma (default: todas)')
+    run.add_argument('--start', required=True, dest='fecha_inicio', help='fecha_inicio (ISO8601)')
+    run.add_argument('--end', required=True, dest='fecha_fin', help='fecha_fin (ISO8601, inclusive)')
+    run.add_argument('--resume-from', dest='resume_from', help='Checkpoint de reanudación')
+    run.add_argument('--workers', type=int, default=1, help='Procesos en paralelo (1 = mismo proceso)')
+    run.add_argument('--page-size', type=int, dest='page_size')
+    run.add_argument('--fetch-mode', choices=['sequential', 'count_first'], dest='fetch_mode')
+    run.add_argument('--extract-mode', choices=['windowed', 'snapshot'], dest='extract_mode',
+                     help='snapshot: entidad completa + diff, siempre en el mismo proceso (ver README)')
+    run.add_argument('--max-window-seconds', type=int, dest='max_window_seconds')
+    run.add_argument('--dry-run', action='store_true', dest='dry_run', help='Solo planificar (ver README 4.4)')
+    run.add_argument('--plan-samples', type=int, dest='plan_samples')
+
+    worker = commands.add_parser('worker', help='Procesa tramos de raw.qb_backfill_queue')
+    worker.add_argument('--worker-id', dest='worker_id')
+    worker.add_argument('--max-windows', type=int, dest='max_windows')
+    worker.add_argument('--no-wait', action='store_false', dest='wait_for_leases',
+                        help='Terminar cuando no haya tramos pendientes aunque otros workers sigan activos')
+    worker.add_argument('--page-size', type=int, dest='page_size')
+    worker.add_argument('--fetch-mode', choices=['sequential', 'count_first'], dest='fetch_mode')
+
+    flatten = commands.add_parser('flatten', help='Reconstruye las tablas planas de analytics desde RAW')
+    flatten.add_argument('--entities', help='Entidades separadas por coma (default: todas)')
+
+    reconcile = commands.add_parser('reconcile', help='Compara COUNT(*) por tramo y re-extrae los que difieren')
+    reconcile.add_argument('--entities', help='Entidades separadas por coma (default: todas)')
+    reconcile.add_argument('--start', required=True, dest='fecha_inicio', help='fecha_inicio (ISO8601)')
+    reconcile.add_argument('--end', required=True, dest='fecha_fin', help='fecha_fin (ISO8601, inclusive)')
+    reconcile.add_argument('--dry-run', action='store_true', dest='dry_run', help='Solo comparar, sin re-extraer')
+    reconcile.add_argument('--page-size', type=int, dest='page_size')
+    reconcile.add_argument('--fetch-mode', choices=['sequential', 'count_first'], dest='fetch_mode')
+    reconcile.add_argument('--max-window-seconds', type=int, dest='max_window_seconds')
+    return parser
+
+
+def _init_worker(overrides, log_level):
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    secrets.set_overrides(overrides)
+    logger = logging.getLogger('qbo.cli')
+    _worker['logger'] = logger
+    _worker['client'] = QboClient(load_qbo_settings(), logger)
+    _worker['db_params'] = load_db_params()
+    _worker['pool'] = create_db_pool(_worker['db_params'], 1, logger)
+
+
+def _process_window(window, options):
+    logger = _worker['logger']
+    df = extract_window(window, client=_worker['client'], logger=logger, **options)
+    if not df.empty:
+        export_entity(df.drop(columns=['entity']), window['entity'], logger,
+                      _worker['db_params'], _worker['pool'])
+    return len(df)
+
+
+def run_parallel(entity_names, workers, logger, options, log_level):
+    """Reparte los tramos entre `workers` procesos. Devuelve los tramos fallidos."""
+    windows = plan_windows(entity_names, logger=logger, **options)
+    failed = []
+    total_records = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(secrets.get_overrides(), log_level)) as executor:
+        futures = [(window, executor.submit(_process_window, window, options)) for window in windows]
+        for window, future in futures:
+            try:
+                total_records += future.result()
+            except Exception as e:
+                logger.error(f"[CLI] {window['entity']} tramo {window['extract_window_start_utc']} falló: {str(e)}")
+                failed.append(dict(window, error=str(e), attempts=1))
+
+    logger.info(f"[CLI] Tramos: {len(windows)} | Registros: {total_records} | Fallidos: {len(failed)}")
+    for window in failed:
+        logger.critical(f"[CHECKPOINT] Reintentar {window['entity']}: --start {window['extract_window_start_utc']} "
+                        f"--end {window['extract_window_end_utc']}")
+    realm_id = load_qbo_settings()['realm_id']
+    failed_keys = {(window['entity'], window['extract_window_start_utc']) for window in failed}
+    for entity in entity_names:
+        record_dead_letters(entity, realm_id,
+                            [window for window in failed if window['entity'] == entity],
+                            [(window['extract_window_start_utc'], window['extract_window_end_utc'])
+                             for window in windows
+                             if window['entity'] == entity and (entity, window['extract_window_start_utc']) not in failed_keys],
+                            logger)
+    return failed
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format=LOG_FORMAT)
+    logger = logging.getLogger('qbo.cli')
+
+    if args.secrets_file:
+        logger.info(f"[CONFIG] {secrets.load_secrets_file(args.secrets_file)} secretos cargados de {args.secrets_file}")
+    if args.env_secrets is not None:
+        secrets.use_environment(args.env_secrets)
+
+    options = {key: value for key, value in vars(args).items()
+               if value is not None and key not in ('command', 'secrets_file', 'env_secrets', 'log_level',
+                                                    'entities', 'workers')}
+
+    if args.command == 'worker':
+        run_worker(logger=logger, **options)
+        return 0
+
+    entity_names = parse_entities(args.entities)
+    if args.command == 'flatten':
+        conn = get_db_connection_with_retry(load_db_params(), logger)
+        try:
+            for entity in entity_names:
+                flatten_entity(conn, entity, f"{SCHEMA_NAME}.{get_entity_config(entity)['table']}", logger)
+        finally:
+            conn.close()
+        return 0
+
+    if args.command == 'reconcile':
+        client = QboClient(load_qbo_settings(), logger)
+        report = compare_windows(entity_names, client, logger=logger, **options)
+        if not args.dry_run:
+            report = refetch_mismatches(report, client, logger=logger, **options)
+        return 0 if report.empty or report['status'].isin([MATCH, REPAIRED]).all() else 1
+
+    # El snapshot no se reparte por tramos: corre en este proceso aunque haya --workers
+    if args.workers > 1 and not args.dry_run and args.extract_mode != 'snapshot':
+        failed = run_parallel(entity_names, args.workers, logger, options, args.log_level.upper())
+        return 1 if failed else 0
+
+    df = extract_entities(entity_names, logger=logger, **options)
+    if args.dry_run:
+        return 0
+    export_entities(df, logger)
+    return 1 if df.attrs.get('pipeline_failed') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Configuración tipada de QBO y Postgres para todos los bloques. Cada valor sale
+de utils/secrets.py, que guarda en caché por proceso los secretos de Mage
+(`SECRET_TTL_SECONDS`), así que un bloque, hijo dinámico o worker no repite
+consultas a la base de Mage. Los valores se validan y convierten aquí: un
+secreto faltante o mal formado falla al arrancar, no a mitad de un tramo.
+"""
+from default_repo.utils.secrets import get_secret_value
+
+QBO_URLS = {
+    'sandbox': "https://sandbox-quickbooks.api.intuit.com/v3/company",
+    'production': "https://quickbooks.api.intuit.com/v3/company"
+}
+
+# (clave, secreto, tipo, obligatorio)
+QBO_APP_SECRETS = [
+    ('client_id', 'QBO_CLIENT_ID', str, True),
+    ('client_secret', 'QBO_CLIENT_SECRET', str, True),
+    ('environment', 'QBO_ENVIRONMENT', str, True),
+]
+QBO_REALM_SECRETS = [
+    ('refresh_token', 'QBO_REFRESH_TOKEN', str, True),
+    ('realm_id', 'QBO_REALM_ID', str, True),
+]
+DB_SECRETS = [
+    ('host', 'POSTGRES_HOST', str, True),
+    ('database', 'POSTGRES_DB', str, True),
+    ('user', 'POSTGRES_USER', str, True),
+    ('password', 'POSTGRES_PASSWORD', str, False),
+    ('port', 'POSTGRES_PORT', int, True),
+]
+
+
+def resolve(spec):
+    """Dict {clave: valor convertido} según `spec`; ValueError si falta o no convierte."""
+    settings = {}
+    for key, secret, value_type, required in spec:
+        value = get_secret_value(secret)
+        if value is None or value == '':
+            if required:
+                raise ValueError(f"[SECURITY] {secret} no configurado en Mage Secrets")
+            settings[key] = value
+            continue
+        try:
+            settings[key] = value_type(str(value).strip())
+        except ValueError:
+            raise ValueError(f"[CONFIG] {secret} debe ser {value_type.__name__} (recibido: {value!r}).")
+    return settings
+
+
+def qbo_base_url(environment):
+    environment = environment.lower()
+    if environment not in QBO_URLS:
+        raise ValueError(f"[CONFIG] QBO_ENVIRONMENT debe ser {' o '.join(QBO_URLS)} (recibido: {environment}).")
+    return QBO_URLS[environment]
+
+
+def load_qbo_app_settings():
+    """Secretos de la app de Intuit, comunes a todos los realms."""
+    settings = resolve(QBO_APP_SECRETS)
+    settings['base_url'] = qbo_base_url(settings['environment'])
+    return settings
+
+
+def load_qbo_settings():
+    """Secretos de QBO (app + realm único)."""
+    settings = load_qbo_app_settings()
+    settings.update(resolve(QBO_REALM_SECRETS))
+    settings['refresh_token_secret'] = 'QBO_REFRESH_TOKEN'
+    return settings
+
+
+def load_db_params():
+    """Parámetros de conexión para psycopg2."""
+    return resolve(DB_SECRETS)
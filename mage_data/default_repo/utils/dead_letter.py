@@ -0,0 +1,92 @@
+"""
+Dead letters: tramos que fallaron incluso tras la pasada final de reintento.
+Quedan en `raw.qb_dead_letter_windows` con el error y los intentos, para
+reprocesarlos con `fecha_inicio`/`fecha_fin` del tramo. Cuando un tramo se
+extrae y se carga bien en una ejecución posterior, su fila se marca como
+resuelta: el Loader deja los tramos exitosos en `df.attrs['succeeded_windows']`
+y el Exporter los resuelve después de confirmar la carga.
+"""
+from default_repo.utils.config import load_db_params
+from default_repo.utils.pg_load import SCHEMA_NAME, get_db_connection_with_retry
+
+DEAD_LETTER_TABLE = f"{SCHEMA_NAME}.qb_dead_letter_windows"
+
+
+def ensure_dead_letter_table(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('raw_ddl'));")
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_NAME};")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DEAD_LETTER_TABLE} (
+            entity VARCHAR NOT NULL,
+            realm_id VARCHAR NOT NULL,
+            extract_window_start_utc TIMESTAMP WITH TIME ZONE NOT NULL,
+            extract_window_end_utc TIMESTAMP WITH TIME ZONE NOT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            last_error TEXT,
+            first_failed_at_utc TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            last_failed_at_utc TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            resolved_at_utc TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (entity, realm_id, extract_window_start_utc, extract_window_end_utc)
+        );
+    """)
+    conn.commit()
+    cur.close()
+
+
+def record_dead_letters(entity, realm_id, failed, succeeded, logger):
+    """
+    Registra los tramos `failed` (dicts con inicio, fin, error e intentos) y
+    marca como resueltos los `succeeded` ((inicio, fin)) que estaban pendientes.
+    Un error al escribir no detiene el pipeline: los tramos ya quedaron en el log.
+    """
+    if not failed and not succeeded:
+        return
+    try:
+        conn = get_db_connection_with_retry(load_db_params(), logger)
+    except Exception as e:
+        logger.warning(f"[DEAD-LETTER] No se pudo registrar en {DEAD_LETTER_TABLE}: {str(e)}")
+        return
+    try:
+        ensure_dead_letter_table(conn)
+        cur = conn.cursor()
+        for letter in failed:
+            cur.execute(f"""
+                INSERT INTO {DEAD_LETTER_TABLE} (entity, realm_id, extract_window_start_utc,
+                                                 extract_window_end_utc, attempts, last_error)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (entity, realm_id, extract_window_start_utc, extract_window_end_utc) DO UPDATE SET
+                    attempts = {DEAD_LETTER_TABLE}.attempts + EXCLUDED.attempts,
+                    last_error = EXCLUDED.last_error,
+                    last_failed_at_utc = now(),
+                    resolved_at_utc = NULL;
+            """, (entity, realm_id, letter['extract_window_start_utc'], letter['extract_window_end_utc'],
+                  letter['attempts'], letter['error']))
+        if succeeded:
+            starts, ends = zip(*succeeded)
+            cur.execute(f"""
+                UPDATE {DEAD_LETTER_TABLE} SET resolved_at_utc = now()
+                WHERE entity = %s AND realm_id = %s AND resolved_at_utc IS NULL
+                  AND (extract_window_start_utc, extract_window_end_utc) IN (
+                      SELECT * FROM unnest(%s::timestamptz[], %s::timestamptz[]));
+            """, (entity, realm_id, list(starts), list(ends)))
+            if cur.rowcount:
+                logger.info(f"[DEAD-LETTER] {cur.rowcount} tramos pendientes de {entity} marcados como resueltos.")
+        conn.commit()
+        cur.close()
+        if failed:
+            logger.warning(f"[DEAD-LETTER] {len(failed)} tramos de {entity} registrados en {DEAD_LETTER_TABLE}.")
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"[DEAD-LETTER] No se pudo registrar en {DEAD_LETTER_TABLE}: {str(e)}")
+    finally:
+        conn.close()
+
+
+def resolve_dead_letters(windows, logger):
+    """Marca como resueltos los tramos `windows` ((entidad, realm_id, inicio, fin)) ya cargados."""
+    by_entity = {}
+    for entity, realm_id, window_start, window_end in windows or []:
+        by_entity.setdefault((entity, realm_id), []).append((window_start, window_end))
+    for (entity, realm_id), succeeded in by_entity.items():
+        record_dead_letters(entity, realm_id, [], succeeded, logger)
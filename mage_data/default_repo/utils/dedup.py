@@ -0,0 +1,38 @@
+"""
+Validación y deduplicación vectorizada de un lote de registros RAW. Un mismo
+`id` puede llegar en varios tramos si se modificó durante el backfill; se
+conserva solo la versión más reciente según `source_last_updated_utc`.
+"""
+import pandas as pd
+
+KEY_COLUMNS = ['realm_id', 'id']
+
+
+def dedup_latest(df):
+    """
+    Descarta registros sin `id` y deja una fila por (realm_id, id): la de mayor
+    `source_last_updated_utc` (a igualdad, la última extraída). Devuelve
+    (df, ids_nulos, duplicados_descartados) conservando el orden original.
+    """
+    if df is None or df.empty:
+        return df, 0, 0
+
+    ids = df['id']
+    valid = ids.notna() & (ids.astype(str).str.len() > 0)
+    null_ids = int((~valid).sum())
+    if null_ids:
+        df = df[valid]
+
+    keys = [column for column in KEY_COLUMNS if column in df.columns]
+    duplicated = df.duplicated(subset=keys, keep=False)
+    if not duplicated.any():
+        return df, null_ids, 0
+
+    source_ts = pd.to_datetime(df['source_last_updated_utc'], utc=True, errors='coerce', format='ISO8601')
+    latest = (df.assign(_source_ts=source_ts)
+                .sort_values('_source_ts', kind='stable', na_position='first')
+                .drop_duplicates(subset=keys, keep='last')
+                .sort_index()
+                .drop(columns='_source_ts'))
+    latest.attrs = dict(df.attrs)
+    return latest, null_ids, len(df) - len(latest)
@@ -0,0 +1,62 @@
+"""
+Registro de entidades QBO. Agregar una entidad (ej: Payment, Bill) es
+agregar su entrada aquí; Loader, Exporter y pipelines la toman de este dict.
+"""
+
+DEFAULT_ENTITY_CONFIG = {
+    'chunk_days': 1,             # Tamaño del segmento
+    'page_size': 10,             # Registros por petición
+    'fetch_mode': 'sequential',  # 'sequential' | 'count_first'
+    'extract_mode': 'windowed',  # 'windowed' (tramos por fecha) | 'snapshot' (entidad completa + diff)
+    'snapshot_page_size': 1000,  # Registros por página en modo snapshot (máximo de QBO)
+    'history': False,            # Historial append-only de versiones en <table>_history (ver utils/pg_load.py)
+    # Ritmo adaptativo (AIMD), ver utils/pacing.py
+    'pacing': {
+        'min_interval': 0.0,
+        'max_interval': 10.0,
+        'additive_step': 0.05,
+        'multiplicative_factor': 2.0,
+        'latency_factor': 2.0,
+        'base_backoff': 5,
+        'max_backoff': 120.0,
+    },
+    # Peticiones de respaldo para páginas lentas, ver utils/timeouts.py
+    'hedge': {
+        'enabled': False,
+        'percentile': 95,        # Percentil del tiempo hasta las cabeceras que dispara el respaldo
+    },
+}
+
+ENTITIES = {
+    'Invoice': {'table': 'qb_invoice'},
+    # Dimensiones pequeñas: admiten `extract_mode = 'snapshot'` como variable de runtime
+    'Customer': {'table': 'qb_customer'},
+    'Item': {'table': 'qb_item'},
+}
+
+
+def get_entity_config(entity):
+    """Configuración completa de una entidad: defaults + valores propios."""
+    if entity not in ENTITIES:
+        raise ValueError(f"[CONFIG] Entidad '{entity}' no registrada. Disponibles: {', '.join(ENTITIES)}")
+    overrides = ENTITIES[entity]
+    config = dict(DEFAULT_ENTITY_CONFIG)
+    config.update(overrides)
+    config['pacing'] = {**DEFAULT_ENTITY_CONFIG['pacing'], **overrides.get('pacing', {})}
+    config['hedge'] = {**DEFAULT_ENTITY_CONFIG['hedge'], **overrides.get('hedge', {})}
+    config['entity'] = entity
+    config.setdefault('table', f"qb_{entity.lower()}")
+    config.setdefault('history_table', f"{config['table']}_history")
+    return config
+
+
+def parse_entities(value):
+    """Lista de entidades desde una variable de runtime ('Invoice,Item'); vacío = todas."""
+    if not value:
+        return list(ENTITIES)
+    if isinstance(value, str):
+        value = value.split(',')
+    entities = [entity.strip() for entity in value if entity and entity.strip()]
+    for entity in entities:
+        get_entity_config(entity)
+    return entities
@@ -0,0 +1,210 @@
+"""
+Tablas planas para analítica en el esquema `analytics`, derivadas de los
+payload JSONB de `raw`. Después de cada carga el Exporter aplana solo los
+registros que escribió (`flatten_entity`), así que las consultas leen
+columnas tipadas e indexadas en vez de desarmar el JSONB en cada consulta.
+
+Cada tabla se define en `FLAT_TABLES` como (columna, tipo, ruta JSON). Una
+fila solo se reescribe si cambió su `payload_hash`; las líneas de una factura
+se reemplazan completas cuando cambia su cabecera.
+"""
+import time
+
+FLAT_SCHEMA = 'analytics'
+FLATTEN_BATCH_SIZE = 5000   # Registros por transacción de aplanado
+
+FLAT_TABLES = {
+    'Invoice': {
+        'table': 'invoice_header',
+        'columns': [
+            ('doc_number', 'VARCHAR', '{DocNumber}'),
+            ('txn_date', 'DATE', '{TxnDate}'),
+            ('due_date', 'DATE', '{DueDate}'),
+            ('customer_id', 'VARCHAR', '{CustomerRef,value}'),
+            ('customer_name', 'VARCHAR', '{CustomerRef,name}'),
+            ('currency', 'VARCHAR', '{CurrencyRef,value}'),
+            ('exchange_rate', 'NUMERIC', '{ExchangeRate}'),
+            ('total_amt', 'NUMERIC', '{TotalAmt}'),
+            ('total_tax', 'NUMERIC', '{TxnTaxDetail,TotalTax}'),
+            ('balance', 'NUMERIC', '{Balance}'),
+            ('email_status', 'VARCHAR', '{EmailStatus}'),
+            ('created_at_utc', 'TIMESTAMP WITH TIME ZONE', '{MetaData,CreateTime}'),
+        ],
+        'indexes': ['customer_id', 'txn_date'],
+        # Una fila por elemento de `Line`, reemplazadas cuando cambia la factura
+        'children': [{
+            'table': 'invoice_line',
+            'parent_key': 'invoice_id',
+            'array': '{Line}',
+            'columns': [
+                ('line_id', 'VARCHAR', '{Id}'),
+                ('line_num', 'INT', '{LineNum}'),
+                ('detail_type', 'VARCHAR', '{DetailType}'),
+                ('description', 'VARCHAR', '{Description}'),
+                ('amount', 'NUMERIC', '{Amount}'),
+                ('item_id', 'VARCHAR', '{SalesItemLineDetail,ItemRef,value}'),
+                ('item_name', 'VARCHAR', '{SalesItemLineDetail,ItemRef,name}'),
+                ('qty', 'NUMERIC', '{SalesItemLineDetail,Qty}'),
+                ('unit_price', 'NUMERIC', '{SalesItemLineDetail,UnitPrice}'),
+                ('tax_code', 'VARCHAR', '{SalesItemLineDetail,TaxCodeRef,value}'),
+            ],
+            'indexes': ['item_id'],
+        }],
+    },
+    'Customer': {
+        'table': 'customer',
+        'columns': [
+            ('display_name', 'VARCHAR', '{DisplayName}'),
+            ('company_name', 'VARCHAR', '{CompanyName}'),
+            ('given_name', 'VARCHAR', '{GivenName}'),
+            ('family_name', 'VARCHAR', '{FamilyName}'),
+            ('email', 'VARCHAR', '{PrimaryEmailAddr,Address}'),
+            ('phone', 'VARCHAR', '{PrimaryPhone,FreeFormNumber}'),
+            ('bill_city', 'VARCHAR', '{BillAddr,City}'),
+            ('bill_country', 'VARCHAR', '{BillAddr,Country}'),
+            ('currency', 'VARCHAR', '{CurrencyRef,value}'),
+            ('balance', 'NUMERIC', '{Balance}'),
+            ('active', 'BOOLEAN', '{Active}'),
+            ('created_at_utc', 'TIMESTAMP WITH TIME ZONE', '{MetaData,CreateTime}'),
+        ],
+        'indexes': ['display_name'],
+    },
+    'Item': {
+        'table': 'item',
+        'columns': [
+            ('name', 'VARCHAR', '{Name}'),
+            ('sku', 'VARCHAR', '{Sku}'),
+            ('type', 'VARCHAR', '{Type}'),
+            ('unit_price', 'NUMERIC', '{UnitPrice}'),
+            ('purchase_cost', 'NUMERIC', '{PurchaseCost}'),
+            ('qty_on_hand', 'NUMERIC', '{QtyOnHand}'),
+            ('income_account_id', 'VARCHAR', '{IncomeAccountRef,value}'),
+            ('expense_account_id', 'VARCHAR', '{ExpenseAccountRef,value}'),
+            ('active', 'BOOLEAN', '{Active}'),
+            ('created_at_utc', 'TIMESTAMP WITH TIME ZONE', '{MetaData,CreateTime}'),
+        ],
+        'indexes': ['name'],
+    },
+}
+
+# Claves (realm_id, id) del lote como tabla
+KEYS_SQL = "SELECT * FROM unnest(%s::varchar[], %s::varchar[])"
+
+
+def _select_columns(columns, source):
+    # Un texto vacío cuenta como nulo para que el cast no falle
+    return ', '.join(f"NULLIF({source} #>> '{path}', '')::{column_type}" for _, column_type, path in columns)
+
+
+def _column_names(columns):
+    return ', '.join(name for name, _, _ in columns)
+
+
+def ensure_flat_tables(cur, spec):
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('raw_ddl'));")
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {FLAT_SCHEMA};")
+    columns = ',\n'.join(f"{name} {column_type}" for name, column_type, _ in spec['columns'])
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {FLAT_SCHEMA}.{spec['table']} (
+            realm_id VARCHAR NOT NULL,
+            id VARCHAR NOT NULL,
+            {columns},
+            source_last_updated_utc TIMESTAMP WITH TIME ZONE,
+            payload_hash VARCHAR,
+            flattened_at_utc TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (realm_id, id)
+        );
+    """)
+    for child in spec.get('children', []):
+        columns = ',\n'.join(f"{name} {column_type}" for name, column_type, _ in child['columns'])
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {FLAT_SCHEMA}.{child['table']} (
+                realm_id VARCHAR NOT NULL,
+                {child['parent_key']} VARCHAR NOT NULL,
+                line_index INT NOT NULL,
+                {columns},
+                PRIMARY KEY (realm_id, {child['parent_key']}, line_index)
+            );
+        """)
+    for table in [spec] + spec.get('children', []):
+        for column in table.get('indexes', []):
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {table['table']}_{column}_idx "
+                        f"ON {FLAT_SCHEMA}.{table['table']} ({column});")
+
+
+def flatten_batch(cur, spec, raw_table, keys):
+    """
+    Aplana un lote de claves (realm_id, id) de `raw_table`. Devuelve cuántas
+    cabeceras cambiaron; las que ya tenían el mismo `payload_hash` no se tocan.
+    """
+    table = f"{FLAT_SCHEMA}.{spec['table']}"
+    names = _column_names(spec['columns'])
+    realm_ids, ids = [list(values) for values in zip(*keys)]
+    cur.execute(f"""
+        INSERT INTO {table} (realm_id, id, {names}, source_last_updated_utc, payload_hash, flattened_at_utc)
+        SELECT r.realm_id, r.id, {_select_columns(spec['columns'], 'r.payload')},
+               r.source_last_updated_utc, r.payload_hash, now()
+        FROM {raw_table} r
+        WHERE (r.realm_id, r.id) IN ({KEYS_SQL})
+        ON CONFLICT (realm_id, id) DO UPDATE SET
+            {', '.join(f"{name} = EXCLUDED.{name}" for name, _, _ in spec['columns'])},
+            source_last_updated_utc = EXCLUDED.source_last_updated_utc,
+            payload_hash = EXCLUDED.payload_hash,
+            flattened_at_utc = EXCLUDED.flattened_at_utc
+        WHERE EXCLUDED.payload_hash IS NULL OR {table}.payload_hash IS DISTINCT FROM EXCLUDED.payload_hash
+        RETURNING realm_id, id;
+    """, (realm_ids, ids))
+    changed = cur.fetchall()
+    if not changed or not spec.get('children'):
+        return len(changed)
+
+    realm_ids, ids = [list(values) for values in zip(*changed)]
+    for child in spec['children']:
+        child_table = f"{FLAT_SCHEMA}.{child['table']}"
+        cur.execute(f"DELETE FROM {child_table} WHERE (realm_id, {child['parent_key']}) IN ({KEYS_SQL});",
+                    (realm_ids, ids))
+        cur.execute(f"""
+            INSERT INTO {child_table} (realm_id, {child['parent_key']}, line_index, {_column_names(child['columns'])})
+            SELECT r.realm_id, r.id, l.line_index, {_select_columns(child['columns'], 'l.line')}
+            FROM {raw_table} r
+            CROSS JOIN LATERAL jsonb_array_elements(
+                CASE WHEN jsonb_typeof(r.payload #> '{child['array']}') = 'array'
+                     THEN r.payload #> '{child['array']}' ELSE '[]'::jsonb END
+            ) WITH ORDINALITY AS l(line, line_index)
+            WHERE (r.realm_id, r.id) IN ({KEYS_SQL});
+        """, (realm_ids, ids))
+    return len(changed)
+
+
+def flatten_entity(conn, entity, raw_table, logger, keys=None):
+    """
+    Actualiza las tablas planas de `entity` con las claves (realm_id, id)
+    escritas en `raw_table`. Sin `keys` reconstruye la entidad completa.
+    Cada lote de `FLATTEN_BATCH_SIZE` se confirma por separado.
+    """
+    spec = FLAT_TABLES.get(entity)
+    if spec is None:
+        return
+    start_time = time.time()
+    cur = conn.cursor()
+    try:
+        ensure_flat_tables(cur, spec)
+        conn.commit()
+        if keys is None:
+            cur.execute(f"SELECT realm_id, id FROM {raw_table};")
+            keys = cur.fetchall()
+        keys = list(keys)
+
+        changed = 0
+        for offset in range(0, len(keys), FLATTEN_BATCH_SIZE):
+            # Dos cargas de la misma entidad no reemplazan las líneas de una factura a la vez
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (f"flatten_{entity}",))
+            changed += flatten_batch(cur, spec, raw_table, keys[offset:offset + FLATTEN_BATCH_SIZE])
+            conn.commit()
+        logger.info(f"[FLATTEN] {FLAT_SCHEMA}.{spec['table']}: {changed} de {len(keys)} registros "
+                    f"actualizados en {round(time.time() - start_time, 2)}s.")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
@@ -0,0 +1,133 @@
+"""
+Extracción de varias compañías (realms) en paralelo sobre un pool de procesos.
+Cada proceso tiene su propio QboClient: tokens, sesión HTTP y ritmo por realm,
+que es como QBO aplica sus límites.
+"""
+from default_repo.utils.secrets import get_secret_value
+import json
+import logging
+import os
+import pandas as pd
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from default_repo.utils.config import load_qbo_app_settings, qbo_base_url
+from default_repo.utils.qbo_extract import QboClient, extract_entities
+
+# Variables de runtime que cada proceso crea por su cuenta en vez de recibirlas
+LOCAL_KEYS = ('logger', 'client')
+
+
+def parse_realms(value):
+    """
+    Lista de realms desde la variable `realms`: ids separados por coma, una
+    lista YAML o JSON. Cada elemento puede ser un id o un dict con `realm_id`
+    y opcionalmente `environment` y `refresh_token_secret`.
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        value = json.loads(value) if value.startswith('[') else value.split(',')
+    realms = []
+    for item in value:
+        realm = dict(item) if isinstance(item, dict) else {'realm_id': str(item).strip()}
+        if not realm.get('realm_id'):
+            raise ValueError(f"[VALIDATION] Configuración de realm sin 'realm_id': {item}")
+        realm['realm_id'] = str(realm['realm_id'])
+        realms.append(realm)
+    return realms
+
+
+def load_realm_settings(realms):
+    """
+    Settings completos por realm. El refresh token de cada compañía se lee del
+    secreto `QBO_REFRESH_TOKEN_<realm_id>` (o el indicado en `refresh_token_secret`).
+    """
+    app_settings = load_qbo_app_settings()
+    all_settings = []
+    for realm in realms:
+        secret_name = realm.get('refresh_token_secret') or f"QBO_REFRESH_TOKEN_{realm['realm_id']}"
+        refresh_token = get_secret_value(secret_name)
+        if not refresh_token:
+            raise ValueError(f"[SECURITY] {secret_name} no configurado en Mage Secrets")
+        settings = dict(app_settings)
+        settings['realm_id'] = realm['realm_id']
+        settings['refresh_token'] = refresh_token
+        settings['refresh_token_secret'] = secret_name
+        if realm.get('environment'):
+            settings['environment'] = realm['environment']
+            settings['base_url'] = qbo_base_url(realm['environment'])
+        all_settings.append(settings)
+    return all_settings
+
+
+def runtime_options(kwargs):
+    """
+    Variables de runtime que se envían a cada proceso: todas menos el logger,
+    el cliente y los objetos que no se pueden serializar (ej: el contexto de
+    Mage). Así una variable nueva llega a los procesos sin tocar este módulo.
+    """
+    options = {}
+    for key, value in kwargs.items():
+        if key in LOCAL_KEYS:
+            continue
+        try:
+            pickle.dumps(value)
+        except Exception:
+            continue
+        options[key] = value
+    return options
+
+
+def _extract_realm(settings, entity_names, options):
+    # Punto de entrada de cada proceso del pool
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    logger = logging.getLogger(f"qbo.realm.{settings['realm_id']}")
+    client = QboClient(settings, logger)
+    df = extract_entities(entity_names, client=client, logger=logger, **options)
+    return df, dict(df.attrs)
+
+
+def extract_realms(realm_settings, entity_names, workers=None, **kwargs):
+    """
+    Reparte los realms en un pool de procesos y une sus resultados en un
+    DataFrame con columnas `realm_id` y `entity`.
+    """
+    logger = kwargs.get('logger')
+    options = runtime_options(kwargs)
+    workers = min(int(workers or os.cpu_count() or 1), len(realm_settings))
+    logger.info(f"[MULTI-REALM] {len(realm_settings)} realms | Entidades: {', '.join(entity_names)} | "
+                f"Procesos: {workers}")
+
+    frames = []
+    checkpoints = {}
+    succeeded_windows = []
+    failed_realms = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {settings['realm_id']: executor.submit(_extract_realm, settings, entity_names, options)
+                   for settings in realm_settings}
+        for realm_id, future in futures.items():
+            try:
+                df_realm, attrs = future.result()
+            except Exception as e:
+                logger.error(f"[MULTI-REALM] Realm {realm_id} falló: {str(e)}")
+                failed_realms.append(realm_id)
+                continue
+            checkpoints[realm_id] = attrs.get('last_checkpoint')
+            succeeded_windows.extend(attrs.get('succeeded_windows', []))
+            if attrs.get('pipeline_failed'):
+                failed_realms.append(realm_id)
+            logger.info(f"[MULTI-REALM] Realm {realm_id}: {len(df_realm)} registros.")
+            if not df_realm.empty:
+                frames.append(df_realm)
+
+    if failed_realms:
+        logger.warning(f"[MULTI-REALM] Realms con extracción parcial o fallida: {', '.join(failed_realms)}")
+
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if not df.empty:
+        df.attrs['last_checkpoint'] = checkpoints
+        df.attrs['pipeline_failed'] = bool(failed_realms)
+        df.attrs['original_fecha_fin'] = kwargs.get('fecha_fin')
+        df.attrs['succeeded_windows'] = succeeded_windows
+    return df
@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+DEFAULT_PACING = {
+    'min_interval': 0.0,        # Pausa mínima entre peticiones (s)
+    'max_interval': 10.0,       # Pausa máxima entre peticiones (s)
+    'additive_step': 0.05,      # Reducción de la pausa por respuesta sana (s)
+    'multiplicative_factor': 2.0,  # Multiplicador de la pausa ante 429/latencia
+    'throttle_floor': 0.5,      # Pausa mínima tras un 429 (s)
+    'latency_factor': 2.0,      # Latencia > factor * EWMA se considera degradación
+    'latency_alpha': 0.2,       # Peso de la última muestra en el EWMA
+    'base_backoff': 5.0,        # Segundos base del backoff
+    'max_backoff': 120.0,       # Tope del backoff (s)
+}
+
+
+def parse_retry_after(value):
+    """Convierte un header Retry-After (segundos o fecha HTTP) a segundos."""
+    if value is None or value == '':
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptivePacer:
+    """
+    Control de ritmo AIMD entre peticiones a la API.
+
+    Cada respuesta sana reduce la pausa de forma aditiva; un 429 o una latencia
+    que crece sobre su media la multiplican. Los reintentos usan backoff
+    exponencial con full jitter y respetan Retry-After cuando la API lo envía.
+    Es seguro compartirlo entre hilos que consultan la misma API.
+    """
+
+    def __init__(self, config=None, logger=None):
+        settings = dict(DEFAULT_PACING)
+        settings.update(config or {})
+        self.min_interval = float(settings['min_interval'])
+        self.max_interval = float(settings['max_interval'])
+        self.additive_step = float(settings['additive_step'])
+        self.multiplicative_factor = float(settings['multiplicative_factor'])
+        self.throttle_floor = float(settings['throttle_floor'])
+        self.latency_factor = float(settings['latency_factor'])
+        self.latency_alpha = float(settings['latency_alpha'])
+        self.base_backoff = float(settings['base_backoff'])
+        self.max_backoff = float(settings['max_backoff'])
+        self.logger = logger
+
+        self.interval = self.min_interval
+        self.latency_ewma = None
+        self.blocked_until = 0.0
+        self._last_request_at = None
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Reserva el siguiente turno y duerme hasta que llegue."""
+        with self._lock:
+            ready_at = max(time.monotonic(), self.blocked_until)
+            if self._last_request_at is not None:
+                ready_at = max(ready_at, self._last_request_at + self.interval)
+            self._last_request_at = ready_at
+        delay = ready_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _increase_interval(self):
+        self.interval = min(
+            self.max_interval,
+            max(self.throttle_floor, self.interval * self.multiplicative_factor)
+        )
+
+    def on_success(self, latency):
+        """Registra una respuesta sana y ajusta la pausa según la latencia."""
+        with self._lock:
+            self._record_latency(latency)
+
+    def _record_latency(self, latency):
+        degraded = (self.latency_ewma is not None
+                    and latency > self.latency_ewma * self.latency_factor)
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = (self.latency_alpha * latency
+                                 + (1 - self.latency_alpha) * self.latency_ewma)
+
+        if degraded:
+            self._increase_interval()
+            if self.logger:
+                self.logger.info(f"[PACING] Latencia {latency:.2f}s sobre la media "
+                                 f"({self.latency_ewma:.2f}s). Pausa: {self.interval:.2f}s")
+        else:
+            self.interval = max(self.min_interval, self.interval - self.additive_step)
+
+    def backoff(self, attempt, retry_after=None):
+        """Segundos de espera para el reintento `attempt` (0-based), con full jitter."""
+        cap = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        wait = random.uniform(0, cap)
+        if retry_after is not None:
+            wait = max(wait, retry_after)
+        return wait
+
+    def on_error(self, attempt):
+        """Registra un error transitorio y devuelve los segundos a esperar."""
+        wait = self.backoff(attempt)
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+        return wait
+
+    def on_throttle(self, attempt, retry_after_header=None):
+        """Registra un 429 y devuelve los segundos a esperar antes de reintentar."""
+        retry_after = parse_retry_after(retry_after_header)
+        wait = self.backoff(attempt, retry_after)
+        with self._lock:
+            self._increase_interval()
+            self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+        return wait
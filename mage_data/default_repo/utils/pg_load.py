@@ -0,0 +1,766 @@
+"""
+Carga genérica a la capa RAW de Postgres. Los Exporters de cada pipeline
+solo indican la entidad; la tabla destino sale de utils/entities.py.
+"""
+from default_repo.utils.secrets import get_secret_value
+import psycopg2
+import io
+import json
+import re
+import time
+import zlib
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from dateutil import parser as date_parser
+from psycopg2.pool import ThreadedConnectionPool
+from default_repo.utils.config import load_db_params
+from default_repo.utils.dedup import dedup_latest
+from default_repo.utils.entities import get_entity_config
+from default_repo.utils.flatten import flatten_entity
+from default_repo.utils.spool import SPOOL_COLUMN, is_manifest, read_spool, remove_spool
+
+MAX_DB_RETRIES = 3
+DB_RETRY_BACKOFF = 2
+SCHEMA_NAME = "raw"
+WRITE_MODE = 'upsert'   # 'upsert' (transaccional, por fila) o 'bulk' (backfills iniciales: COPY a staging UNLOGGED)
+WRITERS = 1             # Conexiones que escriben una entidad en paralelo (shards por hash del id)
+COPY_NULL = r'\N'       # Marca de NULL en el CSV del COPY (modo bulk)
+
+# Columnas que llegan desde Python; `payload_hash` lo calcula Postgres al escribir
+INPUT_COLUMNS = ("realm_id, id, payload, ingested_at_utc, extract_window_start_utc, extract_window_end_utc, "
+                 "page_number, page_size, request_payload, source_last_updated_utc")
+RAW_COLUMNS = f"{INPUT_COLUMNS}, payload_hash"
+INPUT_VALUES = ("%s, %s, %s::jsonb, %s::timestamptz, %s::timestamptz, %s::timestamptz, %s::int, %s::int, %s, "
+                "%s::timestamptz")
+# MD5 del jsonb canónico (claves ordenadas, sin espacios): no depende del formato del texto de QBO
+PAYLOAD_HASH_SQL = "md5(payload::text)"
+
+
+def get_db_connection_with_retry(db_params, logger):
+    retries = 0
+    while retries < MAX_DB_RETRIES:
+        try:
+            conn = psycopg2.connect(**db_params)
+            return conn
+        except psycopg2.OperationalError as e:
+            retries += 1
+            wait = (2 ** retries) * DB_RETRY_BACKOFF
+            logger.warning(f"[DB-RETRY] Error de conexión: {str(e)}. Reintento {retries}/{MAX_DB_RETRIES} en {wait}s")
+            time.sleep(wait)
+    raise Exception(f"[DB-FAIL] No se pudo conectar a Postgres tras {MAX_DB_RETRIES} reintentos.")
+
+
+def create_db_pool(db_params, size, logger):
+    """Pool de conexiones compartido por los Exporters que corren en paralelo."""
+    retries = 0
+    while True:
+        try:
+            return ThreadedConnectionPool(1, size, **db_params)
+        except psycopg2.OperationalError as e:
+            retries += 1
+            if retries >= MAX_DB_RETRIES:
+                raise Exception(f"[DB-FAIL] No se pudo conectar a Postgres tras {MAX_DB_RETRIES} reintentos.")
+            wait = (2 ** retries) * DB_RETRY_BACKOFF
+            logger.warning(f"[DB-RETRY] Error de conexión: {str(e)}. Reintento {retries}/{MAX_DB_RETRIES} en {wait}s")
+            time.sleep(wait)
+
+
+def has_column(cur, schema_name, table_name, column_name):
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s AND column_name = %s;
+    """, (schema_name, table_name, column_name))
+    return cur.fetchone() is not None
+
+
+def add_column(cur, schema_name, table_name, column_name, column_type):
+    # Se consulta el catálogo primero: un ALTER aunque no cambie nada toma ACCESS EXCLUSIVE
+    if not has_column(cur, schema_name, table_name, column_name):
+        cur.execute(f"ALTER TABLE {schema_name}.{table_name} ADD COLUMN {column_name} {column_type};")
+
+
+def migrate_realm_key(cur, schema_name, table_name, logger):
+    """
+    Tablas creadas antes del soporte multi-realm tienen PK (id). Agrega
+    `realm_id`, asigna las filas existentes al realm de QBO_REALM_ID y
+    cambia la PK a (realm_id, id).
+    """
+    add_column(cur, schema_name, table_name, 'realm_id', 'VARCHAR')
+    cur.execute(f"SELECT 1 FROM {schema_name}.{table_name} WHERE realm_id IS NULL LIMIT 1;")
+    if cur.fetchone():
+        legacy_realm = get_secret_value('QBO_REALM_ID')
+        if not legacy_realm:
+            raise ValueError("[SECURITY] QBO_REALM_ID no configurado en Mage Secrets (necesario para migrar filas existentes)")
+        cur.execute(f"UPDATE {schema_name}.{table_name} SET realm_id = %s WHERE realm_id IS NULL;", (legacy_realm,))
+        logger.info(f"[DDL] {cur.rowcount} filas existentes asignadas al realm {legacy_realm}.")
+
+    cur.execute("""
+        SELECT con.conname, array_agg(att.attname::text ORDER BY att.attname)
+        FROM pg_constraint con
+        JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = ANY(con.conkey)
+        WHERE con.conrelid = %s::regclass AND con.contype = 'p'
+        GROUP BY con.conname;
+    """, (f"{schema_name}.{table_name}",))
+    primary_key = cur.fetchone()
+    if primary_key and primary_key[1] == ['id']:
+        cur.execute(f"ALTER TABLE {schema_name}.{table_name} "
+                    f"ALTER COLUMN realm_id SET NOT NULL, "
+                    f"DROP CONSTRAINT {primary_key[0]}, "
+                    f"ADD PRIMARY KEY (realm_id, id);")
+        logger.info(f"[DDL] Clave primaria de {schema_name}.{table_name} migrada a (realm_id, id).")
+
+
+def changed_payload_ids(entity, realm_id, pages, logger, db_params=None):
+    """
+    {id: es_nuevo} de los registros de `pages` (listas de (id, last_updated,
+    payload)) que no están en la tabla RAW del realm o cuyo payload cambió.
+    Base del modo snapshot. La comparación corre en Postgres con el mismo
+    `PAYLOAD_HASH_SQL` que escribe la carga, así que Python no reinterpreta
+    cada payload. Filas con hash NULL o de versiones anteriores se reescriben una vez.
+    """
+    table_name = get_entity_config(entity)['table']
+    conn = get_db_connection_with_retry(db_params or load_db_params(), logger)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s);", (f"{SCHEMA_NAME}.{table_name}",))
+            if cur.fetchone()[0] is None:
+                return {record[0]: True for records in pages for record in records}
+            stored_hash = 'r.payload_hash' if has_column(cur, SCHEMA_NAME, table_name, 'payload_hash') else 'NULL'
+            cur.execute("CREATE TEMP TABLE snapshot_payloads (id VARCHAR, payload JSONB) ON COMMIT DROP;")
+            for records in pages:
+                buffer = io.StringIO()
+                for record_id, _, payload in records:
+                    buffer.write(f"{csv_field(record_id)},{csv_field(payload)}\n")
+                buffer.seek(0)
+                cur.copy_expert(f"COPY snapshot_payloads (id, payload) FROM STDIN "
+                                f"WITH (FORMAT csv, NULL '{COPY_NULL}');", buffer)
+            cur.execute(f"""
+                SELECT s.id, r.id IS NULL
+                FROM snapshot_payloads s
+                LEFT JOIN {SCHEMA_NAME}.{table_name} r ON r.realm_id = %s AND r.id = s.id
+                WHERE {stored_hash} IS DISTINCT FROM md5(s.payload::text);
+            """, (realm_id,))
+            return dict(cur.fetchall())
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def load_repair_ids(source, entity, realm_id, logger, db_params=None):
+    """
+    Ids a reparar leídos de la tabla o vista `source` (columna `id`). Si tiene
+    columnas `entity` o `realm_id`, solo se toman las filas de esta entidad y realm.
+    """
+    if not re.fullmatch(r'[A-Za-z_]\w*(\.[A-Za-z_]\w*)?', source):
+        raise ValueError(f"[VALIDATION] Error: 'repair_table' debe ser un nombre de tabla (recibido: {source}).")
+    schema_name, table_name = source.split('.') if '.' in source else ('public', source)
+    conn = get_db_connection_with_retry(db_params or load_db_params(), logger)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s);", (f"{schema_name}.{table_name}",))
+            if cur.fetchone()[0] is None:
+                raise ValueError(f"[VALIDATION] Error: la tabla de reparación {schema_name}.{table_name} no existe.")
+            filters = []
+            params = []
+            for column, value in (('entity', entity), ('realm_id', realm_id)):
+                if has_column(cur, schema_name, table_name, column):
+                    filters.append(f"{column} = %s")
+                    params.append(value)
+            where = f"WHERE {' AND '.join(filters)}" if filters else ''
+            cur.execute(f"SELECT DISTINCT id::varchar FROM {schema_name}.{table_name} {where} ORDER BY 1;", params)
+            return [row[0] for row in cur.fetchall() if row[0]]
+    finally:
+        conn.close()
+
+
+def raw_upsert_sql(schema_name, table_name, source=None, history_table=None):
+    """
+    INSERT ... ON CONFLICT sobre la tabla RAW: VALUES de una fila o SELECT
+    desde `source` (staging). Con `history_table` las filas se insertan
+    primero en el historial (las versiones ya guardadas se ignoran) y a la
+    tabla RAW solo pasan las versiones nuevas que no son anteriores a la vigente.
+    """
+    target = f"{schema_name}.{table_name}"
+    if source:
+        rows = f"SELECT {INPUT_COLUMNS}, {PAYLOAD_HASH_SQL} FROM {source}"
+    else:
+        rows = f"SELECT {INPUT_COLUMNS}, {PAYLOAD_HASH_SQL} FROM (VALUES ({INPUT_VALUES})) AS v ({INPUT_COLUMNS})"
+    on_conflict = """
+        ON CONFLICT (realm_id, id) DO UPDATE SET
+            payload = EXCLUDED.payload,
+            ingested_at_utc = EXCLUDED.ingested_at_utc,
+            extract_window_start_utc = EXCLUDED.extract_window_start_utc,
+            extract_window_end_utc = EXCLUDED.extract_window_end_utc,
+            page_number = EXCLUDED.page_number,
+            page_size = EXCLUDED.page_size,
+            request_payload = EXCLUDED.request_payload,
+            source_last_updated_utc = EXCLUDED.source_last_updated_utc,
+            payload_hash = EXCLUDED.payload_hash
+    """
+    if history_table is None:
+        return f"INSERT INTO {target} ({RAW_COLUMNS}) {rows} {on_conflict};"
+    return f"""
+        WITH inserted AS (
+            INSERT INTO {history_table} ({RAW_COLUMNS}) {rows}
+            ON CONFLICT (realm_id, id, source_last_updated_utc) DO NOTHING
+            RETURNING {RAW_COLUMNS}
+        )
+        INSERT INTO {target} ({RAW_COLUMNS}) SELECT {RAW_COLUMNS} FROM inserted
+        {on_conflict}
+        WHERE EXCLUDED.source_last_updated_utc IS NULL OR {target}.source_last_updated_utc IS NULL
+           OR EXCLUDED.source_last_updated_utc >= {target}.source_last_updated_utc;
+    """
+
+
+def ensure_history_table(cur, schema_name, table_name, history_table_name, logger):
+    """
+    Historial append-only de la entidad: una fila por versión
+    (realm_id, id, source_last_updated_utc). Al crearlo se siembra con las
+    filas vigentes de la tabla RAW.
+    """
+    history_table = f"{schema_name}.{history_table_name}"
+    cur.execute("SELECT to_regclass(%s);", (history_table,))
+    if cur.fetchone()[0] is not None:
+        return
+    # NULLS NOT DISTINCT (Postgres 15+): un registro sin LastUpdatedTime también tiene una sola versión
+    cur.execute(f"""
+        CREATE TABLE {history_table} (
+            LIKE {schema_name}.{table_name} INCLUDING DEFAULTS,
+            CONSTRAINT {history_table_name}_version_key
+                UNIQUE NULLS NOT DISTINCT (realm_id, id, source_last_updated_utc)
+        );
+    """)
+    cur.execute(f"INSERT INTO {history_table} ({RAW_COLUMNS}) SELECT {RAW_COLUMNS} FROM {schema_name}.{table_name};")
+    logger.info(f"[DDL] Historial {history_table} creado con {cur.rowcount} versiones vigentes.")
+
+
+def csv_field(value):
+    """Campo CSV para COPY: NULL como `\\N` sin comillas, números tal cual y el resto entre comillas."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return COPY_NULL
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_to_staging(cur, staging, rows):
+    """
+    COPY de las filas a la staging. Un None llega como NULL igual que en el
+    INSERT por fila; un texto `\\N` va entre comillas y no se confunde con NULL.
+    """
+    buffer = io.StringIO()
+    for values in rows:
+        buffer.write(','.join(csv_field(value) for value in values))
+        buffer.write('\n')
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {staging} ({INPUT_COLUMNS}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}');", buffer)
+
+
+def shard_rows(rows, shards):
+    """Reparte las filas por CRC32 del id: un mismo id siempre va al mismo escritor."""
+    parts = [[] for _ in range(shards)]
+    for values in rows:
+        parts[zlib.crc32(values[1].encode('utf-8')) % shards].append(values)
+    return parts
+
+
+class RawWriter:
+    """
+    Escritura de filas RAW por una conexión. En modo upsert ejecuta un
+    INSERT ... ON CONFLICT por fila; en modo bulk copia cada lote con COPY a
+    una staging UNLOGGED propia de la sesión y lo aplica con un solo INSERT,
+    con `synchronous_commit = off`. Cada lote se confirma por separado.
+    """
+
+    def __init__(self, conn, schema_name, table_name, logger, db_params, bulk=False, pool=None,
+                 history_table=None):
+        self.conn = conn
+        self.cur = conn.cursor()
+        self.schema_name = schema_name
+        self.table_name = table_name
+        self.logger = logger
+        self.db_params = db_params
+        self.bulk = bulk
+        self.pool = pool
+        self.pooled_conn = conn if pool is not None else None
+        self.history_table = history_table
+        self.staging = None
+        self.rows_written = 0
+        self.upsert_sql = raw_upsert_sql(schema_name, table_name, history_table=history_table)
+
+    def start(self):
+        if not self.bulk:
+            return
+        self.staging = f"{self.schema_name}.{self.table_name}_bulk_{self.conn.get_backend_pid()}"
+        self.cur.execute("SET synchronous_commit = off;")
+        self.cur.execute(f"DROP TABLE IF EXISTS {self.staging};")
+        self.cur.execute(f"CREATE UNLOGGED TABLE {self.staging} "
+                         f"(LIKE {self.schema_name}.{self.table_name} INCLUDING DEFAULTS EXCLUDING CONSTRAINTS);")
+        self.conn.commit()
+        # Cada lote viene deduplicado por (realm_id, id): un solo INSERT no toca la misma fila dos veces
+        self.merge_sql = raw_upsert_sql(self.schema_name, self.table_name, self.staging, self.history_table)
+
+    def write(self, rows):
+        """Escribe y confirma un lote de filas (tuplas en el orden de INPUT_COLUMNS)."""
+        if self.bulk:
+            if rows:
+                copy_to_staging(self.cur, self.staging, rows)
+                self.cur.execute(self.merge_sql)
+                self.cur.execute(f"TRUNCATE {self.staging};")
+            self.conn.commit()
+        else:
+            self.upsert_batch(rows)
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def upsert_batch(self, rows):
+        """
+        INSERT ... ON CONFLICT por fila y commit del lote. Si se cae la conexión,
+        lo no confirmado se pierde con ella: se reconecta y se repite el lote
+        completo (el upsert es idempotente), no solo la fila que falló.
+        """
+        retry_count = 0
+        while True:
+            try:
+                for values in rows:
+                    self.cur.execute(self.upsert_sql, values)
+                self.conn.commit()
+                return
+            except psycopg2.OperationalError:
+                retry_count += 1
+                if retry_count >= MAX_DB_RETRIES:
+                    raise
+                self.logger.warning(f"[DB-RETRY] Conexión perdida en el lote de {len(rows)} filas, reconectando "
+                                    f"y repitiendo el lote... {retry_count}/{MAX_DB_RETRIES}")
+                time.sleep(DB_RETRY_BACKOFF * retry_count)
+                # Si no se puede reconectar, el error se propaga y el tramo se reintenta
+                new_conn = get_db_connection_with_retry(self.db_params, self.logger)
+                self.release()
+                self.conn = new_conn
+                self.cur = self.conn.cursor()
+
+    def finish(self):
+        """Elimina la staging y restaura la sesión (la conexión puede volver a un pool)."""
+        if self.staging is None:
+            return
+        self.conn.rollback()
+        self.cur.execute(f"DROP TABLE IF EXISTS {self.staging};")
+        self.cur.execute("RESET synchronous_commit;")
+        self.conn.commit()
+        self.staging = None
+
+    def abort(self):
+        try:
+            self.conn.rollback()
+            self.finish()
+        except Exception as e:
+            self.logger.critical(f"[BULK] No se pudo limpiar la carga masiva ({str(e)}). "
+                                 f"Eliminar {self.staging} manualmente.")
+
+    def release(self):
+        if self.conn is self.pooled_conn:
+            self.pool.putconn(self.conn, close=bool(self.conn.closed))
+        else:
+            self.conn.close()
+
+
+def drop_secondary_indexes(cur, schema_name, table_name, logger):
+    """
+    Elimina los índices no únicos de la tabla y devuelve sus definiciones para
+    recrearlos al final de la carga. La PK y los índices únicos se conservan
+    (los usa el ON CONFLICT).
+    """
+    cur.execute("""
+        SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid)
+        FROM pg_index
+        WHERE indrelid = %s::regclass AND NOT indisprimary AND NOT indisunique;
+    """, (f"{schema_name}.{table_name}",))
+    indexes = cur.fetchall()
+    for index_name, definition in indexes:
+        cur.execute(f"DROP INDEX {index_name};")
+        # Si el proceso muere antes de recrearlo, la definición queda en el log
+        logger.info(f"[BULK] Índice diferido: {definition}")
+    return [definition for _, definition in indexes]
+
+
+def finish_bulk_load(conn, schema_name, table_name, deferred, logger, analyze=True):
+    """Recrea los índices diferidos y actualiza las estadísticas de la tabla tras una carga masiva."""
+    conn.rollback()
+    cur = conn.cursor()
+    try:
+        for definition in deferred:
+            cur.execute(definition)
+            logger.info(f"[BULK] Índice recreado: {definition}")
+        conn.commit()
+        if analyze:
+            analyze_start = time.time()
+            try:
+                cur.execute(f"ANALYZE {schema_name}.{table_name};")
+                conn.commit()
+                logger.info(f"[BULK] ANALYZE {schema_name}.{table_name} en "
+                            f"{round(time.time() - analyze_start, 2)}s.")
+            except Exception as e:
+                # Los datos ya están confirmados: autovacuum actualizará las estadísticas más tarde
+                conn.rollback()
+                logger.warning(f"[BULK] No se pudo ejecutar ANALYZE {schema_name}.{table_name}: {str(e)}")
+    finally:
+        cur.close()
+
+
+def export_entity(df, entity, logger, db_params=None, pool=None, write_mode=None, defer_indexes=False,
+                  writers=None):
+    """
+    Crea la tabla RAW de la entidad si no existe y hace upsert del DataFrame.
+    Con `write_mode='bulk'` cada lote se escribe vía staging UNLOGGED (ver
+    `RawWriter`). Con `writers` > 1 cada lote se reparte por hash del id entre
+    esa cantidad de conexiones que escriben en paralelo.
+    """
+    start_time_load = time.time()
+
+    entity_config = get_entity_config(entity)
+    table_name = entity_config['table']
+    schema_name = SCHEMA_NAME
+    history_table = f"{schema_name}.{entity_config['history_table']}" if entity_config['history'] else None
+    write_mode = write_mode or WRITE_MODE
+    if write_mode not in ('upsert', 'bulk'):
+        raise ValueError(f"[VALIDATION] Error: 'write_mode' debe ser 'upsert' o 'bulk' (recibido: {write_mode}).")
+    bulk = write_mode == 'bulk'
+    writers = int(writers or WRITERS)
+    if writers < 1:
+        raise ValueError(f"[VALIDATION] Error: 'writers' debe ser al menos 1 (recibido: {writers}).")
+
+    if df is None or df.empty:
+        logger.warning(f"[VOLUMETRY] No hay datos para la entidad {table_name}. Fin de ejecución.")
+        return
+
+    try:
+        if db_params is None:
+            db_params = load_db_params()
+        pooled_conn = pool.getconn() if pool is not None else None
+        conn = pooled_conn or get_db_connection_with_retry(db_params, logger)
+        cur = conn.cursor()
+    except Exception as e:
+        logger.error(f"[SECURITY/DB] Error al obtener secretos o conectar a Postgres: {str(e)}")
+        raise e
+
+    def release(connection):
+        if connection is pooled_conn:
+            pool.putconn(connection, close=bool(connection.closed))
+        else:
+            connection.close()
+
+    try:
+        cur.execute("BEGIN;")
+        # Serializa el DDL entre Exporters concurrentes (CREATE ... IF NOT EXISTS no es atómico)
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('raw_ddl'));")
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema_name};")
+
+        create_table_query = f"""
+            CREATE TABLE IF NOT EXISTS {schema_name}.{table_name} (
+                realm_id VARCHAR NOT NULL,
+                id VARCHAR NOT NULL,
+                payload JSONB,
+                ingested_at_utc TIMESTAMP WITH TIME ZONE,
+                extract_window_start_utc TIMESTAMP WITH TIME ZONE,
+                extract_window_end_utc TIMESTAMP WITH TIME ZONE,
+                page_number INT,
+                page_size INT,
+                request_payload TEXT,
+                source_last_updated_utc TIMESTAMP WITH TIME ZONE,
+                payload_hash VARCHAR,
+                PRIMARY KEY (realm_id, id)
+            );
+        """
+        cur.execute(create_table_query)
+        migrate_realm_key(cur, schema_name, table_name, logger)
+        add_column(cur, schema_name, table_name, 'payload_hash', 'VARCHAR')
+        if history_table:
+            ensure_history_table(cur, schema_name, table_name, entity_config['history_table'], logger)
+        conn.commit()
+        logger.info(f"[DDL] Tabla {schema_name}.{table_name} creada/verificada exitosamente.")
+    except Exception as e:
+        logger.error(f"[DDL] Error creando infraestructura RAW: {str(e)}")
+        conn.rollback()
+        release(conn)
+        raise e
+
+    try:
+        cur.execute(f"SELECT COUNT(*) FROM {schema_name}.{table_name}")
+        count_before = cur.fetchone()[0]
+        if history_table:
+            cur.execute(f"SELECT COUNT(*) FROM {history_table}")
+            history_before = cur.fetchone()[0]
+    except:
+        count_before = history_before = 0
+
+    deferred = []
+    cur.close()
+    writer = RawWriter(conn, schema_name, table_name, logger, db_params, bulk, pool, history_table)
+    cur = writer.cur
+    shard_pool = None
+    shard_writers = []
+    rows_processed = 0
+    rows_with_temporal_issues = 0
+    rows_skipped_null_id = 0
+    rows_received = 0
+    rows_deduplicated = 0
+    chunk_metrics = {}
+    written_keys = []
+
+    # Un manifiesto de spool se lee por lotes; un DataFrame normal es un único lote
+    spool_paths = df[SPOOL_COLUMN].tolist() if is_manifest(df) else []
+    batches = read_spool(spool_paths) if spool_paths else [df]
+
+    try:
+        if bulk and defer_indexes:
+            deferred = drop_secondary_indexes(cur, schema_name, table_name, logger)
+            conn.commit()
+        if writers > 1:
+            # Cada escritor usa su propia conexión (y backend de Postgres) y recibe los ids de su shard
+            shard_pool = create_db_pool(db_params, writers, logger)
+            shard_writers = [RawWriter(shard_pool.getconn(), schema_name, table_name, logger, db_params,
+                                       bulk, shard_pool, history_table) for _ in range(writers)]
+        active_writers = shard_writers or [writer]
+        for active in active_writers:
+            active.start()
+        if bulk:
+            logger.info(f"[BULK] Modo bulk: {len(active_writers)} staging UNLOGGED, synchronous_commit = off, "
+                        f"{len(deferred)} índices diferidos.")
+        if shard_writers:
+            logger.info(f"[SHARD] {writers} escritores en paralelo sobre {schema_name}.{table_name} "
+                        f"(reparto por hash del id).")
+
+        for batch in batches:
+            rows_received += len(batch)
+            # Una fila por (realm_id, id): la versión más reciente del lote
+            batch, null_ids, duplicates = dedup_latest(batch)
+            if null_ids:
+                logger.error(f"[VALIDATION] {null_ids} registros con ID nulo omitidos en exporter.")
+            rows_skipped_null_id += null_ids
+            rows_deduplicated += duplicates
+            rows = []
+            for _, row in batch.iterrows():
+                if not row['id'] or pd.isna(row['id']):
+                    logger.error(f"[VALIDATION] Registro con ID nulo omitido en exporter.")
+                    rows_skipped_null_id += 1
+                    continue
+
+                chunk_key = f"{row['extract_window_start_utc']}|{row['extract_window_end_utc']}"
+                if chunk_key not in chunk_metrics:
+                    chunk_metrics[chunk_key] = {
+                        'count': 0,
+                        'window_start': row['extract_window_start_utc'],
+                        'window_end': row['extract_window_end_utc']
+                    }
+                chunk_metrics[chunk_key]['count'] += 1
+
+                ingested_at = row['ingested_at_utc']
+                window_end_str = row['extract_window_end_utc']
+                source_updated = row.get('source_last_updated_utc', '')
+
+                try:
+                    window_end_dt = date_parser.parse(window_end_str) if isinstance(window_end_str, str) else window_end_str
+                    if ingested_at.tzinfo is None:
+                        ingested_at = ingested_at.replace(tzinfo=timezone.utc)
+                    if window_end_dt.tzinfo is None:
+                        window_end_dt = window_end_dt.replace(tzinfo=timezone.utc)
+
+                    if ingested_at < window_end_dt:
+                        rows_with_temporal_issues += 1
+                        logger.debug(f"[TEMPORAL-WARNING] Registro {row['id']}: ingested_at < extract_window_end")
+                except Exception as parse_error:
+                    logger.debug(f"[TEMPORAL-PARSE] No se pudo validar temporalidad para {row['id']}: {parse_error}")
+
+                source_updated_ts = None
+                if source_updated:
+                    try:
+                        source_updated_ts = date_parser.parse(source_updated)
+                        window_start_str = row['extract_window_start_utc']
+                        window_start_dt = date_parser.parse(window_start_str) if isinstance(window_start_str, str) else window_start_str
+                        if source_updated_ts.tzinfo is None:
+                            source_updated_ts = source_updated_ts.replace(tzinfo=timezone.utc)
+                        if window_start_dt.tzinfo is None:
+                            window_start_dt = window_start_dt.replace(tzinfo=timezone.utc)
+                        if source_updated_ts < window_start_dt or source_updated_ts >= window_end_dt:
+                            logger.warning(f"[TEMPORAL-ANOMALY] Registro {row['id']}: source_last_updated fuera de ventana")
+                    except:
+                        source_updated_ts = None
+
+                payload = row['payload'] if isinstance(row['payload'], str) else json.dumps(row['payload'])
+                values = (
+                    str(row['realm_id']),
+                    str(row['id']),
+                    payload,
+                    row['ingested_at_utc'],
+                    row['extract_window_start_utc'],
+                    row['extract_window_end_utc'],
+                    row['page_number'],
+                    row['page_size'],
+                    row['request_payload'],
+                    source_updated_ts
+                )
+                rows.append(values)
+
+            if shard_writers:
+                with ThreadPoolExecutor(max_workers=len(shard_writers)) as executor:
+                    list(executor.map(lambda shard_writer, shard: shard_writer.write(shard),
+                                      shard_writers, shard_rows(rows, len(shard_writers))))
+            else:
+                writer.write(rows)
+            written_keys.extend((values[0], values[1]) for values in rows)
+
+        for active in active_writers:
+            active.finish()
+        if bulk:
+            finish_bulk_load(writer.conn, schema_name, table_name, deferred, logger)
+        rows_processed = sum(active.rows_written for active in active_writers)
+        logger.info(f"[LOAD] Upsert exitoso: {rows_processed} filas procesadas en {table_name}.")
+        remove_spool(spool_paths)
+
+    except Exception as e:
+        logger.error(f"[LOAD] Fallo en la carga de datos: {str(e)}")
+        for active in shard_writers or [writer]:
+            active.abort()
+        if deferred:
+            try:
+                finish_bulk_load(writer.conn, schema_name, table_name, deferred, logger, analyze=False)
+            except Exception as cleanup_error:
+                logger.critical(f"[BULK] No se pudieron recrear los índices diferidos ({str(cleanup_error)}). "
+                                f"Ejecutar las sentencias [BULK] Índice diferido del log.")
+        writer.conn.rollback()
+        release(writer.conn)
+        raise e
+
+    finally:
+        for shard_writer in shard_writers:
+            shard_writer.release()
+        if shard_pool is not None:
+            shard_pool.closeall()
+
+    # Un reintento de conexión del escritor principal pudo reemplazar la conexión
+    conn, cur = writer.conn, writer.cur
+
+    # Las tablas planas son derivadas: si fallan, RAW ya quedó cargado y se pueden reconstruir
+    try:
+        flatten_entity(conn, entity, f"{schema_name}.{table_name}", logger, written_keys)
+    except Exception as e:
+        logger.error(f"[FLATTEN] No se pudieron actualizar las tablas planas de {entity}: {str(e)}. "
+                     f"Reconstruir con `python -m default_repo.utils.cli flatten --entities {entity}`.")
+
+    # Metricas
+    try:
+        cur.execute(f"SELECT COUNT(*) FROM {schema_name}.{table_name}")
+        count_after = cur.fetchone()[0]
+
+        new_inserts = count_after - count_before
+        updates = rows_processed - new_inserts if rows_processed > new_inserts else 0
+        if history_table:
+            # Solo las versiones nuevas llegan a la tabla RAW; las repetidas no se reescriben
+            cur.execute(f"SELECT COUNT(*) FROM {history_table}")
+            new_versions = cur.fetchone()[0] - history_before
+            updates = max(0, new_versions - new_inserts)
+
+        if new_inserts < 0:
+            new_inserts = 0
+            updates = rows_processed
+        omitted = rows_received - rows_processed
+
+        logger.info("--- REPORTE DE CALIDAD ---")
+        logger.info(f"[QUALITY] Entidad: {table_name}")
+        logger.info(f"[QUALITY] Registros en DataFrame: {rows_received}")
+        logger.info(f"[QUALITY] Total registros en tabla (antes): {count_before}")
+        logger.info(f"[QUALITY] Total registros en tabla (después): {count_after}")
+        if history_table:
+            logger.info(f"[HISTORY] Versiones nuevas en {history_table}: {new_versions} "
+                        f"(total: {history_before + new_versions}). Versiones repetidas ignoradas: "
+                        f"{rows_processed - new_versions}")
+        if shard_writers:
+            logger.info(f"[SHARD] Filas por escritor: "
+                        f"{' | '.join(f'#{i + 1}: {w.rows_written}' for i, w in enumerate(shard_writers))}")
+
+        if rows_with_temporal_issues > 0:
+            logger.warning(f"[TEMPORAL-QUALITY] {rows_with_temporal_issues} registros con posibles "
+                           f"inconsistencias temporales (ingested_at < extract_window_end).")
+
+        if rows_skipped_null_id > 0:
+            logger.warning(f"[INTEGRITY] {rows_skipped_null_id} registros omitidos por ID nulo.")
+
+        if rows_deduplicated > 0:
+            logger.info(f"[DEDUP] {rows_deduplicated} versiones anteriores de registros repetidos descartadas.")
+
+        logger.info("--- VOLUMETRÍA POR TRAMO ---")
+        for chunk_key, metrics in chunk_metrics.items():
+            logger.info(f"[CHUNK-VOLUMETRY] Ventana: [{metrics['window_start']} - {metrics['window_end']}] | "
+                        f"Registros: {metrics['count']}")
+
+            if metrics['count'] == 0:
+                logger.warning(f"[VOLUMETRY] ALERTA: Tramo vacío detectado: {chunk_key}")
+        logger.info(f"[VOLUMETRY] Total tramos procesados: {len(chunk_metrics)}")
+
+        if rows_processed == 0 and rows_received > 0:
+            logger.warning("[QUALITY] ALERTA: El DataFrame tenía datos pero no se procesó nada en Postgres.")
+
+    except Exception as e:
+        logger.warning(f"[QUALITY] No se pudo generar reporte de volumetría: {str(e)}")
+
+    try:
+        pipeline_failed = False
+        if hasattr(df, 'attrs'):
+            pipeline_failed = df.attrs.get('pipeline_failed', False)
+
+        if pipeline_failed:
+            logger.warning(f"[EXPORTER] Datos de extracción parcial exportados exitosamente.")
+            logger.warning(f"[EXPORTER] Revisar logs del Loader para instrucciones de reanudación.")
+        else:
+            logger.info(f"[EXPORTER] Pipeline completado exitosamente.")
+    except Exception as e:
+        logger.warning(f"[EXPORTER] No se pudo verificar estado del pipeline: {str(e)}")
+
+    finally:
+        cur.close()
+        release(conn)
+
+    # La carga ya se confirmó: recién ahora los tramos exitosos cierran sus dead letters.
+    # Import local: dead_letter importa este módulo
+    from default_repo.utils.dead_letter import resolve_dead_letters
+    resolve_dead_letters(df.attrs.get('succeeded_windows'), logger)
+
+    # Resumen final
+    duration = round(time.time() - start_time_load, 2)
+    logger.info("--- RESUMEN FINAL ---")
+    logger.info(f"Registros procesados: {rows_processed}")
+    logger.info(f"Nuevos: {new_inserts} | Actualizados: {updates} | Omitidos: {omitted}")
+    logger.info(f"Duración: {duration} segundos")
+    logger.info(f"Coherencia Temporal: Marcas registradas en UTC")
+    logger.info("--------------------------------------------")
+
+
+def export_entities(df, logger, write_mode=None, defer_indexes=False, writers=None):
+    """
+    Exporta un DataFrame multi-entidad (columna `entity`) escribiendo cada
+    entidad en paralelo sobre un pool de conexiones compartido.
+    """
+    if df is None or df.empty:
+        logger.warning("[VOLUMETRY] No hay datos para exportar. Fin de ejecución.")
+        return
+
+    groups = []
+    for entity, df_entity in df.groupby('entity'):
+        df_entity = df_entity.drop(columns=['entity']).reset_index(drop=True)
+        df_entity.attrs['pipeline_failed'] = df.attrs.get('pipeline_failed', False)
+        df_entity.attrs['succeeded_windows'] = [window for window in df.attrs.get('succeeded_windows', [])
+                                                if window[0] == entity]
+        groups.append((entity, df_entity))
+
+    db_params = load_db_params()
+    pool = create_db_pool(db_params, len(groups), logger)
+    try:
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [executor.submit(export_entity, df_entity, entity, logger, db_params, pool,
+                                       write_mode, defer_indexes, writers)
+                       for entity, df_entity in groups]
+            for future in futures:
+                future.result()
+    finally:
+        pool.closeall()
@@ -0,0 +1,84 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+RATE_LIMIT_PER_MINUTE = 500  # Límite de la API de QBO por realm
+WINDOW_FORMAT = '%Y-%m-%dT%H:%M:%S+00:00'
+
+
+def build_windows(dt_start, dt_end, chunk_days):
+    """Tramos [inicio, fin) en UTC, en el mismo orden en que los recorre el Loader."""
+    windows = []
+    current = dt_start
+    while current < dt_end:
+        next_date = min(current + timedelta(days=chunk_days), dt_end)
+        windows.append((current.strftime(WINDOW_FORMAT), next_date.strftime(WINDOW_FORMAT)))
+        current = next_date
+    return windows
+
+
+def sample_indices(total, max_samples):
+    """Índices repartidos uniformemente para muestrear `max_samples` de `total` tramos."""
+    if total <= max_samples:
+        return list(range(total))
+    step = (total - 1) / (max_samples - 1) if max_samples > 1 else total
+    return sorted({round(i * step) for i in range(max_samples)})
+
+
+def estimate_plan(windows, sampled_counts, page_size, fetch_mode, concurrency,
+                  latency, min_interval=0.0, rate_limit_per_minute=RATE_LIMIT_PER_MINUTE):
+    """
+    Calcula peticiones, páginas y duración estimada por tramo.
+
+    `sampled_counts` mapea índice de tramo -> COUNT(*) real; los tramos sin
+    muestra usan el promedio de los muestreados. Devuelve (schedule, summary).
+    """
+    average = (sum(sampled_counts.values()) / len(sampled_counts)) if sampled_counts else 0
+    per_request = latency + min_interval
+    min_seconds_per_request = 60.0 / rate_limit_per_minute
+
+    schedule = []
+    offset = 0.0
+    started_at = datetime.now(timezone.utc)
+    for index, (window_start, window_end) in enumerate(windows):
+        sampled = index in sampled_counts
+        records = sampled_counts[index] if sampled else int(round(average))
+        pages = math.ceil(records / page_size)
+
+        # El access token se cachea, así que solo el COUNT(*) suma peticiones
+        if fetch_mode == 'count_first':
+            # Con la última página llena se pide una más en secuencial por si llegaron registros tras el COUNT
+            trailing = 1 if records > 0 and records % page_size == 0 else 0
+            pages += trailing
+            requests_needed = 1 + pages
+            serial_rounds = 1 + math.ceil((pages - trailing) / concurrency) + trailing
+        else:
+            # El secuencial corta con la primera página incompleta: con un múltiplo exacto
+            # de page_size (o un tramo vacío) hace falta una página vacía más para saberlo
+            pages = records // page_size + 1
+            requests_needed = pages
+            serial_rounds = requests_needed
+        seconds = max(serial_rounds * per_request, requests_needed * min_seconds_per_request)
+
+        schedule.append({
+            'window_index': index + 1,
+            'extract_window_start_utc': window_start,
+            'extract_window_end_utc': window_end,
+            'sampled': sampled,
+            'estimated_records': records,
+            'estimated_pages': pages,
+            'estimated_requests': requests_needed,
+            'estimated_seconds': round(seconds, 2),
+            'estimated_start_utc': started_at + timedelta(seconds=offset),
+        })
+        offset += seconds
+
+    summary = {
+        'windows': len(windows),
+        'sampled_windows': len(sampled_counts),
+        'estimated_records': sum(row['estimated_records'] for row in schedule),
+        'estimated_pages': sum(row['estimated_pages'] for row in schedule),
+        'estimated_requests': sum(row['estimated_requests'] for row in schedule),
+        'estimated_seconds': round(offset, 2),
+        'estimated_finish_utc': started_at + timedelta(seconds=offset),
+    }
+    return schedule, summary
@@ -0,0 +1,986 @@
+"""
+Extracción genérica de entidades QBO. Los Loaders de cada pipeline solo
+indican la entidad; la configuración propia de cada una vive en utils/entities.py.
+"""
+from default_repo.utils.secrets import compare_and_set_secret, read_current_secret
+import requests
+import base64
+import math
+import threading
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from dateutil import parser as date_parser
+from requests.adapters import HTTPAdapter
+from default_repo.utils.circuit import CircuitBreaker, CircuitOpenError
+from default_repo.utils.config import load_qbo_settings
+from default_repo.utils.dead_letter import record_dead_letters
+from default_repo.utils.entities import get_entity_config
+from default_repo.utils.pacing import AdaptivePacer
+from default_repo.utils.pg_load import changed_payload_ids, load_repair_ids
+from default_repo.utils.planner import build_windows, estimate_plan, sample_indices
+from default_repo.utils.raw_json import iter_raw_records, iter_raw_records_stream
+from default_repo.utils.records import RecordBatch
+from default_repo.utils.runtime import parse_flag
+from default_repo.utils.spool import SPOOL_ENABLED, SpoolWriter
+from default_repo.utils.token_broker import TokenBroker
+from default_repo.utils.timeouts import Deadline, DeadlineExceeded, LatencyTracker, hedged_get
+
+MAX_RETRIES = 5                  # Reintentos
+QUERY_BREAKER = {}               # Circuit breaker del endpoint de consultas (ver utils/circuit.py)
+TOKEN_BREAKER = {'failure_threshold': 3}  # Circuit breaker del endpoint OAuth
+TOKEN_RETRY_SECONDS = 5          # Pausa entre reintentos de OAuth mientras el circuito sigue cerrado
+REQUEST_TIMEOUT = (5, 30)        # Timeout (conexión, lectura) por petición en segundos
+WINDOW_DEADLINE_SECONDS = 900    # Presupuesto por tramo (None = sin límite)
+RUN_DEADLINE_SECONDS = None      # Presupuesto de la ejecución completa (None = sin límite)
+DEAD_LETTER_RETRY_SECONDS = 600  # Presupuesto de la pasada final sobre tramos fallidos (None = sin límite)
+PAGE_CONCURRENCY = 4             # Páginas simultáneas en modo count_first (QBO admite 10)
+PLAN_SAMPLE_WINDOWS = 20         # Tramos muestreados con COUNT(*) en modo dry_run
+REPAIR_BATCH_SIZE = 200          # Ids por consulta WHERE Id IN (...) en modo reparación
+ACCESS_TOKEN_TTL = 3300          # Segundos de reutilización del access token (QBO: 3600)
+TOKEN_BROKER_ENABLED = True      # Un solo proceso renueva el token por realm (ver utils/token_broker.py)
+HTTP_POOL_SIZE = 10              # Conexiones HTTP reutilizables por proceso
+JSON_PASSTHROUGH = True          # Conservar el JSON original de cada registro (ver utils/raw_json.py)
+STREAM_MIN_PAGE_SIZE = 100       # Desde este page_size las páginas se parsean en streaming
+STREAM_CHUNK_SIZE = 64 * 1024    # Bytes por lectura del stream
+
+TOKEN_URL = "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer"
+WINDOW_FORMAT = '%Y-%m-%dT%H:%M:%S+00:00'
+SNAPSHOT_WINDOW_START = '1970-01-01T00:00:00+00:00'  # Inicio de "ventana" de un snapshot (toda la historia)
+
+
+def parse_to_utc(date_str):
+    try:
+        dt = date_parser.parse(date_str)
+    except Exception as e:
+        raise ValueError(f"[VALIDATION] Error parseando fecha '{date_str}': {str(e)}. "
+                         f"Formato esperado: ISO 8601 (ej: 2024-01-01T00:00:00Z)")
+
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+
+    return dt.astimezone(timezone.utc)
+
+
+def get_new_access_token(client_id, client_secret, refresh_token, logger, session=None):
+    logger.info(f"[AUTH] Iniciando autenticación OAuth 2.0...")
+
+    auth_header = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+    headers = {
+        'Authorization': f'Basic {auth_header}',
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Accept': 'application/json'
+    }
+    payload = {'grant_type': 'refresh_token', 'refresh_token': refresh_token}
+
+    post = session.post if session is not None else requests.post
+    response = post(TOKEN_URL, headers=headers, data=payload, timeout=REQUEST_TIMEOUT)
+    if response.status_code >= 500:
+        # Caída de Intuit: la reintenta TokenState detrás del circuit breaker
+        raise requests.exceptions.HTTPError(f"OAuth no disponible: HTTP {response.status_code}", response=response)
+    if response.status_code != 200:
+        logger.error(f"[AUTH] Error en OAuth: {response.text}")
+        raise Exception(f"OAuth Failure: {response.status_code}")
+
+    token_data = response.json()
+    access_token = token_data.get('access_token')
+    new_refresh_token = token_data.get('refresh_token')
+
+    logger.info(f"[AUTH] Access Token obtenido exitosamente")
+
+    if new_refresh_token and new_refresh_token != refresh_token:
+        logger.warning(f"[AUTH-ROTATION] NUEVO REFRESH TOKEN EMITIDO.")
+    else:
+        logger.info(f"[AUTH] Refresh Token sin cambios.")
+
+    return access_token, new_refresh_token
+
+
+class TokenState:
+    """
+    Caché del access/refresh token compartida por todos los hilos de un realm.
+    Con `broker` la renovación se coordina además entre procesos.
+    """
+
+    def __init__(self, client_id, client_secret, refresh_token, logger, session=None,
+                 refresh_token_secret=None, broker=None, breaker=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.refresh_token_secret = refresh_token_secret
+        self.broker = broker
+        self.breaker = breaker
+        self.access_token = None
+        self.expires_at = 0.0
+        self.logger = logger
+        self.session = session
+        self._lock = threading.Lock()
+
+    def ensure_valid(self):
+        """Devuelve un access token vigente, renovándolo solo si está por expirar."""
+        with self._lock:
+            if self.access_token and time.monotonic() < self.expires_at:
+                return self.access_token
+        return self.refresh()
+
+    def refresh(self, stale_token=None):
+        # Si otro hilo ya renovó mientras se esperaba el lock (el token que falló
+        # o uno por expirar), se reutiliza el nuevo en vez de renovar otra vez
+        with self._lock:
+            if stale_token is not None and self.access_token != stale_token:
+                return self.access_token
+            if stale_token is None and self.access_token and time.monotonic() < self.expires_at:
+                return self.access_token
+            if self.broker is not None:
+                access_token, lifetime = self.broker.get_access_token(self.renew, ACCESS_TOKEN_TTL, stale_token)
+            else:
+                access_token, lifetime = self.renew(), ACCESS_TOKEN_TTL
+            self.access_token = access_token
+            self.expires_at = time.monotonic() + lifetime
+            return access_token
+
+    def renew(self):
+        """Pide un access token a QBO y persiste el refresh token si QBO lo rotó."""
+        if self.refresh_token_secret:
+            # Otro proceso pudo rotarlo desde que se leyeron los settings
+            current = read_current_secret(self.refresh_token_secret)
+            if current and current != self.refresh_token:
+                self.logger.info(f"[AUTH-ROTATION] Usando el refresh token vigente de {self.refresh_token_secret}.")
+                self.refresh_token = current
+
+        access_token, new_refresh_token = self.request_token()
+        if new_refresh_token and new_refresh_token != self.refresh_token:
+            if not self.refresh_token_secret:
+                self.logger.warning(f"[AUTH-ROTATION] Sin secreto asociado: el nuevo refresh token solo vive "
+                                    f"en este proceso.")
+            else:
+                self.persist_refresh_token(new_refresh_token)
+            self.refresh_token = new_refresh_token
+        return access_token
+
+    def request_token(self):
+        """
+        Llama al endpoint OAuth. Una caída de Intuit (5xx o red) se reintenta
+        detrás del circuit breaker de tokens; un rechazo (4xx) es de
+        credenciales y se propaga de inmediato.
+        """
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_request()
+            try:
+                result = get_new_access_token(self.client_id, self.client_secret, self.refresh_token,
+                                              self.logger, self.session)
+            except requests.exceptions.RequestException as e:
+                if self.breaker is None:
+                    raise
+                if not self.breaker.on_failure():
+                    self.logger.warning(f"[AUTH] Endpoint OAuth no disponible ({str(e)}). "
+                                        f"Reintento en {TOKEN_RETRY_SECONDS}s.")
+                    time.sleep(TOKEN_RETRY_SECONDS)
+                continue
+            if self.breaker is not None:
+                self.breaker.on_success()
+            return result
+
+    def persist_refresh_token(self, new_refresh_token):
+        # Un fallo al persistir no detiene la extracción: el token nuevo sigue en memoria
+        name = self.refresh_token_secret
+        try:
+            if compare_and_set_secret(name, self.refresh_token, new_refresh_token):
+                self.logger.info(f"[AUTH-ROTATION] {name} actualizado en el almacén de secretos.")
+                return
+            # Alguien cambió el secreto por fuera (ej: pegado manual): no se pisa
+            reason = "cambió durante la renovación; no se sobrescribió"
+        except Exception as e:
+            reason = f"no se pudo escribir ({str(e)})"
+        self.logger.critical(f"[AUTH-ROTATION] {name} {reason}. Actualizar manualmente con: {new_refresh_token}")
+
+
+class QboClient:
+    """
+    Recursos compartidos por todas las entidades de un realm dentro del
+    proceso: sesión HTTP con pool de conexiones, caché de tokens y un circuit
+    breaker por endpoint (consultas y OAuth).
+    """
+
+    def __init__(self, settings, logger):
+        self.settings = settings
+        self.realm_id = settings['realm_id']
+        self.url = f"{settings['base_url']}/{self.realm_id}/query"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        broker = TokenBroker(self.realm_id, settings['client_secret'], logger) if TOKEN_BROKER_ENABLED else None
+        self.query_breaker = CircuitBreaker('query', QUERY_BREAKER, logger)
+        self.token_breaker = CircuitBreaker('token', TOKEN_BREAKER, logger)
+        self.tokens = TokenState(settings['client_id'], settings['client_secret'],
+                                 settings['refresh_token'], logger, self.session,
+                                 settings.get('refresh_token_secret'), broker, self.token_breaker)
+        logger.info(f"[CONFIG] Entorno QBO: {settings['environment']} | URL Base: {settings['base_url']}")
+
+    def run_query(self, query, pacer, latency_tracker, deadline, logger, parse=None, stream=False,
+                  hedge_percentile=None):
+        """
+        Ejecuta una consulta QBO con reintentos. Devuelve el JSON (o lo que
+        devuelva `parse(response)`) o None si se agotan. Con `stream` el cuerpo
+        se consume dentro de `parse`, así que un corte a mitad de la lectura
+        también se reintenta. Los fallos con el circuito abierto no consumen
+        reintentos: la consulta espera a que el endpoint se recupere. Con
+        `hedge_percentile` una página lenta lanza una petición de respaldo.
+        """
+        retries = 0
+        while retries < MAX_RETRIES:
+            pacer.wait()
+            deadline.check()
+            self.query_breaker.before_request(deadline)
+            access_token = self.tokens.ensure_valid()
+            headers = {'Authorization': f'Bearer {access_token}', 'Accept': 'application/json'}
+            try:
+                hedge_after = latency_tracker.percentile(hedge_percentile) if hedge_percentile else None
+                request_start = time.monotonic()
+                response = hedged_get(self.url, hedge_after, logger, session=self.session,
+                                      headers=headers, params={'query': query}, stream=stream,
+                                      timeout=deadline.clamp_timeout(REQUEST_TIMEOUT))
+
+                if response.status_code == 200:
+                    # El respaldo se dispara antes de las cabeceras: el percentil usa
+                    # el tiempo hasta ellas (`elapsed`), sin la descarga ni el parseo
+                    latency_tracker.record(response.elapsed.total_seconds())
+                    try:
+                        result = parse(response) if parse else response.json()
+                    finally:
+                        response.close()
+                    pacer.on_success(time.monotonic() - request_start)
+                    self.query_breaker.on_success()
+                    return result
+                elif response.status_code < 500:
+                    # El endpoint responde: un 429 o un 4xx no son una caída
+                    self.query_breaker.on_success()
+
+                if response.status_code == 429:
+                    wait = pacer.on_throttle(retries, response.headers.get('Retry-After'))
+                    logger.warning(f"[RATE-LIMIT] HTTP 429. Reintento {retries+1}/{MAX_RETRIES} en {wait:.1f}s "
+                                   f"(pausa entre páginas: {pacer.interval:.2f}s)")
+                    retries += 1
+                elif response.status_code == 401:
+                    logger.warning("[AUTH] Token expirado, refrescando...")
+                    self.tokens.refresh(stale_token=access_token)
+                else:
+                    wait = pacer.on_error(retries)
+                    logger.error(f"[API-ERROR] HTTP {response.status_code}: {response.text}. "
+                                 f"Reintento {retries+1}/{MAX_RETRIES} en {wait:.1f}s")
+                    retries = self.failed_attempt(retries) if response.status_code >= 500 else retries + 1
+            except requests.exceptions.RequestException as e:
+                wait = pacer.on_error(retries)
+                logger.error(f"[NETWORK-ERROR] {str(e)}. Reintento {retries+1}/{MAX_RETRIES} en {wait:.1f}s")
+                retries = self.failed_attempt(retries)
+            except ValueError as e:
+                # Cuerpo truncado o JSON inválido
+                wait = pacer.on_error(retries)
+                logger.error(f"[PARSE-ERROR] {str(e)}. Reintento {retries+1}/{MAX_RETRIES} en {wait:.1f}s")
+                retries = self.failed_attempt(retries)
+        return None
+
+    def failed_attempt(self, retries):
+        # Con el circuito abierto la espera la marca el breaker y no cuenta como reintento
+        return retries if self.query_breaker.on_failure() else retries + 1
+
+
+class EntityExtractor:
+    """Paginación, conteo y planificación de una entidad sobre un QboClient."""
+
+    def __init__(self, entity, client, logger, fetch_mode=None, page_size=None, hedge=None, hedge_percentile=None):
+        self.entity = entity
+        self.config = get_entity_config(entity)
+        self.page_size = int(page_size or self.config['page_size'])
+        self.fetch_mode = fetch_mode or self.config['fetch_mode']
+        hedge_enabled = parse_flag(hedge) if hedge is not None else self.config['hedge']['enabled']
+        self.hedge_percentile = (float(hedge_percentile or self.config['hedge']['percentile'])
+                                 if hedge_enabled else None)
+        self.client = client
+        self.logger = logger
+        self.pacer = AdaptivePacer(self.config['pacing'], logger)
+        self.latency_tracker = LatencyTracker()
+
+        if self.fetch_mode not in ('sequential', 'count_first'):
+            raise ValueError(f"[VALIDATION] Error: 'fetch_mode' debe ser 'sequential' o 'count_first' "
+                             f"(recibido: {self.fetch_mode}).")
+
+    def _where(self, chunk_start, chunk_end):
+        if chunk_start is None:
+            return ''  # Snapshot: la entidad completa
+        return (f"WHERE Metadata.LastUpdatedTime >= '{chunk_start}' "
+                f"AND Metadata.LastUpdatedTime < '{chunk_end}'")
+
+    def run_query(self, query, deadline, parse=None, stream=False):
+        return self.client.run_query(query, self.pacer, self.latency_tracker, deadline, self.logger, parse, stream,
+                                     self.hedge_percentile)
+
+    def parse_page(self, response):
+        """
+        Registros (id, last_updated, payload) de una página, conservando el JSON
+        original. El streaming evita la copia del cuerpo, pero la lista retiene el
+        texto de todos los registros de la página.
+        """
+        if self.page_size >= STREAM_MIN_PAGE_SIZE:
+            return list(iter_raw_records_stream(response.iter_content(STREAM_CHUNK_SIZE), self.entity))
+        response.encoding = 'utf-8'  # Evita la detección de charset de requests
+        return list(iter_raw_records(response.text, self.entity))
+
+    def fetch_page(self, chunk_start, chunk_end, start_position, deadline):
+        """Devuelve (start_position, query, registros) con registros como (id, last_updated, payload)."""
+        query = (f"SELECT * FROM {self.entity} {self._where(chunk_start, chunk_end)} "
+                 f"STARTPOSITION {start_position} MAXRESULTS {self.page_size}")
+        return self.fetch_query(query, start_position, deadline)
+
+    def fetch_ids(self, ids, start_position, deadline):
+        """Página con los registros `ids` (WHERE Id IN); mismo formato que `fetch_page`."""
+        id_list = ', '.join(f"'{record_id}'" for record_id in ids)
+        query = f"SELECT * FROM {self.entity} WHERE Id IN ({id_list}) MAXRESULTS {len(ids)}"
+        return self.fetch_query(query, start_position, deadline)
+
+    def fetch_query(self, query, start_position, deadline):
+        if JSON_PASSTHROUGH:
+            records = self.run_query(query, deadline, parse=self.parse_page,
+                                     stream=self.page_size >= STREAM_MIN_PAGE_SIZE)
+            if records is None:
+                return None
+            return start_position, query, records
+
+        result = self.run_query(query, deadline)
+        if result is None:
+            return None
+        records = [(record.get('Id'), record.get('MetaData', {}).get('LastUpdatedTime', ''), record)
+                   for record in result.get('QueryResponse', {}).get(self.entity, [])]
+        return start_position, query, records
+
+    def fetch_sequential(self, chunk_start, chunk_end, deadline, start_position=1):
+        # Paginación: avanza hasta recibir una página incompleta
+        pages = []
+        while True:
+            page = self.fetch_page(chunk_start, chunk_end, start_position, deadline)
+            if page is None:
+                return pages, False
+            pages.append(page)
+            if len(page[2]) < self.page_size:
+                return pages, True
+            start_position += self.page_size
+
+    def count_window(self, chunk_start, chunk_end, deadline):
+        result = self.run_query(f"SELECT COUNT(*) FROM {self.entity} {self._where(chunk_start, chunk_end)}",
+                                deadline)
+        if result is None:
+            return None
+        return int(result.get('QueryResponse', {}).get('totalCount', 0))
+
+    def fetch_count_first(self, chunk_start, chunk_end, deadline):
+        expected = self.count_window(chunk_start, chunk_end, deadline)
+        if expected is None:
+            return [], False
+        if expected == 0:
+            self.logger.info(f"[PLAN] Tramo {chunk_start}: 0 registros esperados.")
+            return [], True
+        total_pages = math.ceil(expected / self.page_size)
+        self.logger.info(f"[PLAN] Tramo {chunk_start}: {expected} registros esperados en {total_pages} páginas.")
+
+        positions = [1 + i * self.page_size for i in range(total_pages)]
+        with ThreadPoolExecutor(max_workers=min(PAGE_CONCURRENCY, total_pages)) as executor:
+            pages = list(executor.map(
+                lambda position: self.fetch_page(chunk_start, chunk_end, position, deadline),
+                positions
+            ))
+        if any(page is None for page in pages):
+            return [page for page in pages if page is not None], False
+
+        # Si llegaron registros nuevos tras el COUNT, la última página viene llena
+        if len(pages[-1][2]) == self.page_size:
+            extra_pages, ok = self.fetch_sequential(chunk_start, chunk_end, deadline,
+                                                    start_position=positions[-1] + self.page_size)
+            pages.extend(extra_pages)
+            if not ok:
+                return pages, False
+
+        unique_ids = {record[0] for page in pages for record in page[2]}
+        if len(unique_ids) < expected:
+            self.logger.warning(f"[COMPLETENESS] Tramo {chunk_start}: {len(unique_ids)} de {expected} registros. "
+                                f"Reintentando el tramo en modo secuencial.")
+            return self.fetch_sequential(chunk_start, chunk_end, deadline)
+        return pages, True
+
+    def fetch_window(self, chunk_start, chunk_end, deadline):
+        """Devuelve (páginas, éxito) del tramo según el modo de paginación."""
+        if self.fetch_mode == 'count_first':
+            return self.fetch_count_first(chunk_start, chunk_end, deadline)
+        return self.fetch_sequential(chunk_start, chunk_end, deadline)
+
+    def build_records(self, pages, chunk_start, chunk_end):
+        # Metadatos: una vez por página, no por registro
+        records = RecordBatch()
+        for start_position, query, data_payload in pages:
+            records.add_page({
+                'realm_id': self.client.realm_id,
+                'extract_window_start_utc': chunk_start,
+                'extract_window_end_utc': chunk_end,
+                'page_number': (start_position // self.page_size) + 1,
+                'page_size': self.page_size,
+                'request_payload': query,
+            }, data_payload)
+        return records
+
+    def plan(self, windows, samples, deadline):
+        logger = self.logger
+        indices = sample_indices(len(windows), samples)
+        logger.info(f"[PLAN] Modo dry_run: muestreando {len(indices)} de {len(windows)} tramos con COUNT(*).")
+
+        sampled_counts = {}
+        latencies = []
+        for index in indices:
+            chunk_start, chunk_end = windows[index]
+            request_start = time.monotonic()
+            count = self.count_window(chunk_start, chunk_end, deadline)
+            if count is None:
+                logger.warning(f"[PLAN] No se pudo contar el tramo {chunk_start}. Se estimará con el promedio.")
+                continue
+            latencies.append(time.monotonic() - request_start)
+            sampled_counts[index] = count
+
+        latency = sum(latencies) / len(latencies) if latencies else 1.0
+        concurrency = PAGE_CONCURRENCY if self.fetch_mode == 'count_first' else 1
+        schedule, summary = estimate_plan(windows, sampled_counts, self.page_size, self.fetch_mode,
+                                          concurrency, latency, self.config['pacing']['min_interval'])
+
+        logger.info("--- PLAN DE BACKFILL (DRY RUN) ---")
+        logger.info(f"[PLAN] Entidad: {self.entity} | Modo: {self.fetch_mode} | PAGE_SIZE: {self.page_size} | "
+                    f"Concurrencia: {concurrency} | Latencia media: {latency:.2f}s")
+        logger.info(f"[PLAN] Tramos: {summary['windows']} (muestreados: {summary['sampled_windows']})")
+        logger.info(f"[PLAN] Registros estimados: {summary['estimated_records']}")
+        logger.info(f"[PLAN] Páginas estimadas: {summary['estimated_pages']}")
+        logger.info(f"[PLAN] Peticiones estimadas: {summary['estimated_requests']}")
+        logger.info(f"[PLAN] ETA: {summary['estimated_seconds']}s "
+                    f"(fin estimado: {summary['estimated_finish_utc'].isoformat()})")
+        for row in schedule:
+            logger.info(f"[PLAN-WINDOW] #{row['window_index']} [{row['extract_window_start_utc']} - "
+                        f"{row['extract_window_end_utc']}] | Registros: {row['estimated_records']}"
+                        f"{'' if row['sampled'] else ' (estimado)'} | Peticiones: {row['estimated_requests']} | "
+                        f"Duración: {row['estimated_seconds']}s")
+
+        df_plan = pd.DataFrame(schedule)
+        df_plan.attrs['dry_run'] = True
+        df_plan.attrs['plan_summary'] = summary
+        return df_plan
+
+
+def contiguous_checkpoint(windows, succeeded_windows):
+    """
+    Fin del último tramo de la racha inicial de tramos exitosos. Un tramo en
+    dead letters corta la racha: reanudar desde ahí no se lo salta.
+    """
+    succeeded = set(succeeded_windows)
+    checkpoint = None
+    for window in windows:
+        if window not in succeeded:
+            break
+        checkpoint = window[1]
+    return checkpoint
+
+
+def log_checkpoint(logger, chunk_index, last_successful_chunk_end):
+    if last_successful_chunk_end:
+        logger.critical(f"[CHECKPOINT] ═══════════════════════════════════════════════════════")
+        logger.critical(f"[CHECKPOINT] PIPELINE INTERRUMPIDO EN TRAMO #{chunk_index}")
+        logger.critical(f"[CHECKPOINT] Tramos completos sin huecos hasta: {last_successful_chunk_end}")
+        logger.critical(f"[CHECKPOINT] ───────────────────────────────────────────────────────")
+        logger.critical(f"[CHECKPOINT] PARA REANUDAR, usar parámetro:")
+        logger.critical(f"[CHECKPOINT] resume_from = '{last_successful_chunk_end}'")
+        logger.critical(f"[CHECKPOINT] ═══════════════════════════════════════════════════════")
+    else:
+        logger.critical(f"[CHECKPOINT] PIPELINE INTERRUMPIDO SIN TRAMOS COMPLETOS: reanudar con el mismo fecha_inicio.")
+
+
+def resolve_range(**kwargs):
+    """Valida `fecha_inicio`/`fecha_fin` y aplica `resume_from`. Devuelve (dt_start, dt_end) en UTC."""
+    logger = kwargs.get('logger')
+    start_date_str = kwargs.get('fecha_inicio')
+    end_date_str = kwargs.get('fecha_fin')
+    resume_from_str = kwargs.get('resume_from')
+
+    if not start_date_str or not end_date_str:
+        raise ValueError("[VALIDATION] Error: 'fecha_inicio' y 'fecha_fin' son obligatorios.")
+
+    dt_start = parse_to_utc(start_date_str)
+    dt_end = parse_to_utc(end_date_str)
+
+    if dt_start >= dt_end:
+        raise ValueError(f"[VALIDATION] Error: 'fecha_inicio' ({dt_start}) debe ser anterior a 'fecha_fin' ({dt_end}).")
+
+    if resume_from_str:
+        dt_resume = parse_to_utc(resume_from_str)
+        if dt_resume > dt_start and dt_resume < dt_end:
+            logger.info(f"[RESUME] Reanudando desde checkpoint: {resume_from_str}")
+            dt_start = dt_resume
+
+    return dt_start, dt_end
+
+
+def extract_snapshot(entity, client=None, **kwargs):
+    """
+    Modo snapshot para dimensiones pequeñas (Customer, Item): trae la entidad
+    completa en pocas páginas grandes y devuelve solo los registros cuyo hash
+    difiere del guardado en la tabla RAW. No usa `fecha_inicio`/`fecha_fin`.
+    """
+    logger = kwargs.get('logger')
+    dry_run = parse_flag(kwargs.get('dry_run'))
+
+    if client is None:
+        client = QboClient(load_qbo_settings(), logger)
+    page_size = kwargs.get('snapshot_page_size') or get_entity_config(entity)['snapshot_page_size']
+    extractor = EntityExtractor(entity, client, logger, 'sequential', page_size,
+                                kwargs.get('hedge'), kwargs.get('hedge_percentile'))
+    run_deadline = Deadline(kwargs.get('max_run_seconds') or RUN_DEADLINE_SECONDS, 'ejecución')
+    deadline = Deadline(kwargs.get('max_window_seconds') or WINDOW_DEADLINE_SECONDS, f"snapshot {entity}",
+                        parent=run_deadline)
+    logger.info(f"[SNAPSHOT] {entity}: entidad completa en páginas de {extractor.page_size} registros.")
+
+    if dry_run:
+        expected = extractor.count_window(None, None, deadline)
+        if expected is None:
+            raise Exception(f"[PLAN] No se pudo contar {entity} en QBO.")
+        pages = expected // extractor.page_size + 1
+        logger.info("--- PLAN DE SNAPSHOT (DRY RUN) ---")
+        logger.info(f"[PLAN] Entidad: {entity} | Registros: {expected} | Páginas: {pages} | Peticiones: {pages}")
+        df_plan = pd.DataFrame([{'entity': entity, 'estimated_records': expected, 'estimated_requests': pages}])
+        df_plan.attrs['dry_run'] = True
+        return df_plan
+
+    start_time = time.time()
+    snapshot_at = datetime.now(timezone.utc).strftime(WINDOW_FORMAT)
+
+    try:
+        pages, success = extractor.fetch_sequential(None, None, deadline)
+    except DeadlineExceeded as e:
+        logger.error(f"[DEADLINE] {str(e)} durante el snapshot de {entity}.")
+        raise
+    if not pages:
+        raise Exception(f"[CHUNK-FAIL] Snapshot de {entity} falló después de {MAX_RETRIES} reintentos.")
+    if not success:
+        logger.warning(f"[EXTRACTION-PARTIAL] Snapshot de {entity} incompleto: se exportan las "
+                       f"{len(pages)} páginas leídas.")
+
+    # Diff en Postgres: solo registros nuevos o con payload distinto al guardado
+    changed_ids = changed_payload_ids(entity, client.realm_id, [records for _, _, records in pages], logger)
+    total = sum(len(records) for _, _, records in pages)
+    new = sum(changed_ids.values())
+    unchanged = total - len(changed_ids)
+    changed_pages = [(start_position, query, [record for record in records if record[0] in changed_ids])
+                     for start_position, query, records in pages]
+    records = extractor.build_records(changed_pages, SNAPSHOT_WINDOW_START, snapshot_at)
+
+    logger.info(f"[SNAPSHOT] {entity}: {total} registros en {len(pages)} páginas | "
+                f"Sin cambios: {unchanged} | Nuevos: {new} | Modificados: {len(records) - new} | "
+                f"Duración: {round(time.time() - start_time, 2)}s")
+
+    spool = parse_flag(kwargs['spool']) if kwargs.get('spool') is not None else SPOOL_ENABLED
+    if spool:
+        writer = SpoolWriter(entity, client.realm_id, kwargs.get('spool_dir'))
+        writer.extend(records)
+        df = writer.manifest()
+    else:
+        df = records.to_frame()
+
+    if not df.empty:
+        df.attrs['last_checkpoint'] = snapshot_at if success else None
+        df.attrs['pipeline_failed'] = not success
+        df.attrs['original_fecha_fin'] = kwargs.get('fecha_fin')
+    return df
+
+
+def parse_repair_ids(value):
+    """Lista de ids desde una variable de runtime ('145,146' o lista), sin repetidos."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    ids = list(dict.fromkeys(str(record_id).strip() for record_id in value if str(record_id).strip()))
+    invalid = [record_id for record_id in ids if "'" in record_id or '\\' in record_id]
+    if invalid:
+        raise ValueError(f"[VALIDATION] Error: ids de reparación inválidos: {', '.join(invalid[:10])}.")
+    return ids
+
+
+def extract_repair(entity, client=None, **kwargs):
+    """
+    Modo reparación: trae solo los registros indicados en `repair_ids` o en la
+    tabla `repair_table`, en lotes de `REPAIR_BATCH_SIZE` con WHERE Id IN (...).
+    El DataFrame tiene el mismo formato que un backfill y pasa por el Exporter
+    de siempre. No usa `fecha_inicio`/`fecha_fin`.
+    """
+    logger = kwargs.get('logger')
+    dry_run = parse_flag(kwargs.get('dry_run'))
+
+    if client is None:
+        client = QboClient(load_qbo_settings(), logger)
+    ids = parse_repair_ids(kwargs.get('repair_ids'))
+    if kwargs.get('repair_table'):
+        table_ids = load_repair_ids(kwargs['repair_table'], entity, client.realm_id, logger)
+        logger.info(f"[REPAIR] {len(table_ids)} ids de {entity} leídos de {kwargs['repair_table']}.")
+        ids = list(dict.fromkeys(ids + parse_repair_ids(table_ids)))
+    batch_size = int(kwargs.get('repair_batch_size') or REPAIR_BATCH_SIZE)
+    batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+    logger.info(f"[REPAIR] {entity}: {len(ids)} ids en {len(batches)} consultas de hasta {batch_size}.")
+
+    if dry_run:
+        df_plan = pd.DataFrame([{'entity': entity, 'estimated_records': len(ids), 'estimated_requests': len(batches)}])
+        df_plan.attrs['dry_run'] = True
+        return df_plan
+    if not ids:
+        logger.warning(f"[REPAIR] No hay ids de {entity} para reparar.")
+        return pd.DataFrame()
+
+    start_time = time.time()
+    extractor = EntityExtractor(entity, client, logger, 'sequential', batch_size,
+                                kwargs.get('hedge'), kwargs.get('hedge_percentile'))
+    run_deadline = Deadline(kwargs.get('max_run_seconds') or RUN_DEADLINE_SECONDS, 'ejecución')
+    repaired_at = datetime.now(timezone.utc).strftime(WINDOW_FORMAT)
+
+    pages = []
+    failed_ids = []
+    for index, batch in enumerate(batches):
+        deadline = Deadline(kwargs.get('max_window_seconds') or WINDOW_DEADLINE_SECONDS,
+                            f"reparación {entity} lote {index + 1}", parent=run_deadline)
+        try:
+            page = extractor.fetch_ids(batch, 1 + index * batch_size, deadline)
+        except DeadlineExceeded as e:
+            logger.error(f"[DEADLINE] {str(e)}")
+            page = None
+        if page is None:
+            logger.error(f"[REPAIR] Lote {index + 1} de {entity} falló después de {MAX_RETRIES} reintentos.")
+            failed_ids.extend(batch)
+            continue
+        pages.append(page)
+
+    records = extractor.build_records(pages, SNAPSHOT_WINDOW_START, repaired_at)
+    found = {record[0] for page in pages for record in page[2]}.union(failed_ids)
+    missing = [record_id for record_id in ids if record_id not in found]
+    if missing:
+        logger.warning(f"[REPAIR] {len(missing)} ids de {entity} no existen en QBO: {', '.join(missing[:20])}"
+                       f"{' ...' if len(missing) > 20 else ''}")
+    if failed_ids:
+        logger.critical(f"[CHECKPOINT] Reintentar la reparación de {entity} con repair_ids = "
+                        f"'{','.join(failed_ids)}'")
+    logger.info(f"[REPAIR] {entity}: {len(records)} registros recuperados de {len(ids)} ids | "
+                f"Peticiones: {len(batches)} | Duración: {round(time.time() - start_time, 2)}s")
+
+    spool = parse_flag(kwargs['spool']) if kwargs.get('spool') is not None else SPOOL_ENABLED
+    if spool:
+        writer = SpoolWriter(entity, client.realm_id, kwargs.get('spool_dir'))
+        writer.extend(records)
+        df = writer.manifest()
+    else:
+        df = records.to_frame()
+
+    if not df.empty:
+        df.attrs['last_checkpoint'] = repaired_at if not failed_ids else None
+        df.attrs['pipeline_failed'] = bool(failed_ids)
+        df.attrs['original_fecha_fin'] = kwargs.get('fecha_fin')
+    return df
+
+
+def extract_entity(entity, client=None, **kwargs):
+    """
+    Backfill por tramos de una entidad. Recibe los kwargs del bloque de Mage
+    (`fecha_inicio`, `fecha_fin`, `resume_from`, ...) y devuelve el DataFrame
+    que consume el Exporter. Las entidades con `extract_mode='snapshot'` se
+    delegan a `extract_snapshot`, y con `repair_ids`/`repair_table` a `extract_repair`.
+    """
+    logger = kwargs.get('logger')
+
+    logger.info(f"[CONFIG] Entidad a extraer: {entity}")
+    if kwargs.get('repair_ids') or kwargs.get('repair_table'):
+        return extract_repair(entity, client, **kwargs)
+    extract_mode = kwargs.get('extract_mode') or get_entity_config(entity)['extract_mode']
+    if extract_mode not in ('windowed', 'snapshot'):
+        raise ValueError(f"[VALIDATION] Error: 'extract_mode' debe ser 'windowed' o 'snapshot' "
+                         f"(recibido: {extract_mode}).")
+    if extract_mode == 'snapshot':
+        return extract_snapshot(entity, client, **kwargs)
+    start_date_str = kwargs.get('fecha_inicio')
+    end_date_str = kwargs.get('fecha_fin')
+    resume_from_str = kwargs.get('resume_from')
+    dry_run = parse_flag(kwargs.get('dry_run'))
+
+    dt_start, dt_end = resolve_range(**kwargs)
+
+    if client is None:
+        client = QboClient(load_qbo_settings(), logger)
+    extractor = EntityExtractor(entity, client, logger, kwargs.get('fetch_mode'), kwargs.get('page_size'),
+                                kwargs.get('hedge'), kwargs.get('hedge_percentile'))
+    logger.info(f"[CONFIG] Modo de paginación: {extractor.fetch_mode}")
+
+    # Variables de control
+    spool = parse_flag(kwargs['spool']) if kwargs.get('spool') is not None else SPOOL_ENABLED
+    all_final_records = RecordBatch()
+    run_deadline = Deadline(kwargs.get('max_run_seconds') or RUN_DEADLINE_SECONDS, 'ejecución')
+    window_deadline_seconds = kwargs.get('max_window_seconds') or WINDOW_DEADLINE_SECONDS
+    total_start_time = time.time()
+    chunk_index = 0
+    pipeline_failed = False
+    circuit_open = False
+    dead_letters = []
+    succeeded_windows = []
+    original_fecha_fin = end_date_str
+
+    # Chunks de días (Tramo)
+    windows = build_windows(dt_start, dt_end + timedelta(seconds=1), extractor.config['chunk_days'])
+
+    if dry_run:
+        return extractor.plan(windows, int(kwargs.get('plan_samples') or PLAN_SAMPLE_WINDOWS), run_deadline)
+
+    # Con spool los registros van a disco tramo a tramo en vez de acumularse en memoria
+    if spool:
+        all_final_records = SpoolWriter(entity, client.realm_id, kwargs.get('spool_dir'))
+        logger.info(f"[SPOOL] Registros en {all_final_records.path}")
+
+    for chunk_start, chunk_end in windows:
+        chunk_index += 1
+        start_time_chunk = time.time()
+
+        if run_deadline.expired():
+            pipeline_failed = True
+            logger.warning(f"[DEADLINE] Presupuesto de la ejecución agotado antes del tramo #{chunk_index}.")
+            log_checkpoint(logger, chunk_index, contiguous_checkpoint(windows, succeeded_windows))
+            break
+        window_deadline = Deadline(window_deadline_seconds, f"tramo {chunk_start}", parent=run_deadline)
+
+        try:
+            logger.info(f"[CHUNK] --- Iniciando Tramo: {chunk_start} a {chunk_end} ---")
+
+            pages, success = extractor.fetch_window(chunk_start, chunk_end, window_deadline)
+
+            # Las páginas leídas se conservan aunque el tramo falle: el upsert es idempotente
+            chunk_records = extractor.build_records(pages, chunk_start, chunk_end)
+            all_final_records.extend(chunk_records)
+            if not success:
+                raise Exception(f"[CHUNK-FAIL] Tramo {chunk_start} falló después de {MAX_RETRIES} reintentos.")
+            succeeded_windows.append((chunk_start, chunk_end))
+            pages_in_chunk = len(pages)
+            records_in_chunk = len(chunk_records)
+
+            # Metricas
+            duration_chunk = round(time.time() - start_time_chunk, 2)
+
+            if records_in_chunk == 0:
+                logger.warning(f"[VOLUMETRY] ALERTA: Tramo {chunk_start} a {chunk_end} retornó 0 registros. "
+                               f"Verificar si es esperado o hay problema de filtros/datos.")
+
+            logger.info(f"[METRICS] Tramo Finalizado: "
+                        f"Páginas: {pages_in_chunk} | "
+                        f"Registros: {records_in_chunk} | "
+                        f"Duración: {duration_chunk}s")
+
+        except Exception as e:
+            if isinstance(e, DeadlineExceeded):
+                logger.warning(f"[DEADLINE] {str(e)} en tramo #{chunk_index} ({chunk_start}).")
+            else:
+                logger.error(f"[CHUNK-ERROR] Error en tramo #{chunk_index} ({chunk_start}): {str(e)}")
+
+            # Un tramo fallido no detiene el backfill: se aparta y se reintenta al final
+            dead_letters.append({'extract_window_start_utc': chunk_start, 'extract_window_end_utc': chunk_end,
+                                 'error': str(e), 'attempts': 1})
+            logger.warning(f"[DEAD-LETTER] Tramo #{chunk_index} ({chunk_start}) apartado para la pasada final. "
+                           f"Se continúa con el siguiente tramo.")
+
+            # Circuit Breaker: las caídas cortas solo pausan; una caída más larga que
+            # `max_open_seconds` (utils/circuit.py) detiene la pasada principal
+            if isinstance(e, CircuitOpenError):
+                circuit_open = True
+                pipeline_failed = True
+                logger.critical(f"[CIRCUIT-BREAKER] QBO sigue caído. Pipeline detenido en el tramo #{chunk_index}.")
+                log_checkpoint(logger, chunk_index + 1, contiguous_checkpoint(windows, succeeded_windows))
+                logger.warning(f"[RECOVERY] Retornando {len(all_final_records)} registros de tramos anteriores.")
+                break
+
+    # Pasada final sobre los tramos fallidos, con su propio presupuesto
+    if dead_letters and not circuit_open:
+        dead_letters = retry_dead_letters(extractor, dead_letters, all_final_records, succeeded_windows,
+                                          window_deadline_seconds, logger, kwargs.get('dead_letter_retry_seconds'),
+                                          run_deadline)
+    if dead_letters:
+        pipeline_failed = True
+        for letter in dead_letters:
+            logger.critical(f"[DEAD-LETTER] Reprocesar {entity}: fecha_inicio = '{letter['extract_window_start_utc']}' "
+                            f"fecha_fin = '{letter['extract_window_end_utc']}' ({letter['error']})")
+    # Con registros por cargar, los tramos exitosos los resuelve el Exporter tras confirmar la carga
+    record_dead_letters(entity, client.realm_id, dead_letters,
+                        [] if len(all_final_records) else succeeded_windows, logger)
+
+    # Resumen final
+    total_duration = round(time.time() - total_start_time, 2)
+
+    if pipeline_failed:
+        logger.warning(f"[EXTRACTION-PARTIAL] === EXTRACCIÓN PARCIAL (CON ERRORES) ===")
+        logger.warning(f"[EXTRACTION-PARTIAL] Tramos completados exitosamente: {len(succeeded_windows)} | "
+                       f"Dead letters: {len(dead_letters)}")
+    else:
+        logger.info(f"[EXTRACTION-COMPLETE] === EXTRACCIÓN FINALIZADA EXITOSAMENTE ===")
+
+    logger.info(f"[EXTRACTION-COMPLETE] Total registros: {len(all_final_records)}")
+    logger.info(f"[EXTRACTION-COMPLETE] Duración total: {total_duration}s")
+    logger.info(f"[EXTRACTION-COMPLETE] Entidad: {entity}")
+    logger.info(f"[EXTRACTION-COMPLETE] Rango solicitado: {start_date_str} a {end_date_str}")
+    if resume_from_str:
+        logger.info(f"[EXTRACTION-COMPLETE] Reanudado desde checkpoint: {resume_from_str}")
+
+    if len(all_final_records) == 0:
+        logger.warning("[VOLUMETRY] No se extrajeron registros. Verificar rango de fechas y datos en QBO.")
+
+    df = all_final_records.manifest() if spool else all_final_records.to_frame()
+
+    if not df.empty:
+        # Los tramos recuperados en la pasada final pueden cerrar los huecos
+        df.attrs['last_checkpoint'] = contiguous_checkpoint(windows, succeeded_windows)
+        df.attrs['pipeline_failed'] = pipeline_failed
+        df.attrs['original_fecha_fin'] = original_fecha_fin
+        df.attrs['dead_letters'] = dead_letters
+        df.attrs['succeeded_windows'] = [(entity, client.realm_id, window_start, window_end)
+                                         for window_start, window_end in succeeded_windows]
+
+    return df
+
+
+def retry_dead_letters(extractor, dead_letters, records, succeeded_windows, window_seconds, logger,
+                       budget_seconds=None, run_deadline=None):
+    """
+    Reintenta los tramos fallidos en orden dentro de `budget_seconds`, sin
+    pasar de `run_deadline`. Agrega los registros recuperados a `records` y
+    devuelve los que siguen fallando.
+    """
+    budget_seconds = budget_seconds or DEAD_LETTER_RETRY_SECONDS
+    budget = Deadline(budget_seconds, 'reintento de dead letters', parent=run_deadline)
+    logger.info(f"[DEAD-LETTER] Pasada final: {len(dead_letters)} tramos "
+                f"(presupuesto: {f'{budget_seconds}s' if budget_seconds else 'sin límite'}).")
+
+    remaining = []
+    for letter in dead_letters:
+        chunk_start = letter['extract_window_start_utc']
+        chunk_end = letter['extract_window_end_utc']
+        if budget.expired():
+            remaining.append(letter)
+            continue
+        try:
+            window_deadline = Deadline(window_seconds, f"tramo {chunk_start}", parent=budget)
+            pages, success = extractor.fetch_window(chunk_start, chunk_end, window_deadline)
+            records.extend(extractor.build_records(pages, chunk_start, chunk_end))
+            if not success:
+                raise Exception(f"[CHUNK-FAIL] Tramo {chunk_start} falló después de {MAX_RETRIES} reintentos.")
+            succeeded_windows.append((chunk_start, chunk_end))
+            logger.info(f"[DEAD-LETTER] Tramo {chunk_start} recuperado en la pasada final.")
+        except Exception as e:
+            logger.error(f"[DEAD-LETTER] Tramo {chunk_start} volvió a fallar: {str(e)}")
+            remaining.append(dict(letter, error=str(e), attempts=letter['attempts'] + 1))
+
+    if budget.expired() and remaining:
+        logger.warning(f"[DEADLINE] Presupuesto de la pasada final agotado con {len(remaining)} tramos pendientes.")
+    return remaining
+
+
+def plan_windows(entity_names, **kwargs):
+    """
+    Lista de tramos (entidad, inicio, fin) del rango pedido, en el mismo orden
+    que `extract_entity`. Es la salida del bloque dinámico de `qb_window_backfill`.
+    """
+    logger = kwargs.get('logger')
+    dt_start, dt_end = resolve_range(**kwargs)
+
+    windows = []
+    for entity in entity_names:
+        chunk_days = get_entity_config(entity)['chunk_days']
+        entity_windows = build_windows(dt_start, dt_end + timedelta(seconds=1), chunk_days)
+        for index, (chunk_start, chunk_end) in enumerate(entity_windows):
+            windows.append({
+                'entity': entity,
+                'window_index': index + 1,
+                'extract_window_start_utc': chunk_start,
+                'extract_window_end_utc': chunk_end,
+            })
+    logger.info(f"[PLAN] {len(windows)} tramos para {', '.join(entity_names)} "
+                f"({dt_start.isoformat()} a {dt_end.isoformat()}).")
+    return windows
+
+
+def extract_window(window, client=None, **kwargs):
+    """
+    Extrae un único tramo de `plan_windows`. A diferencia de `extract_entity`,
+    un fallo se propaga para que Mage marque (y reintente) solo ese bloque hijo.
+    """
+    logger = kwargs.get('logger')
+    entity = window['entity']
+    chunk_start = window['extract_window_start_utc']
+    chunk_end = window['extract_window_end_utc']
+
+    if client is None:
+        client = QboClient(load_qbo_settings(), logger)
+    extractor = EntityExtractor(entity, client, logger, kwargs.get('fetch_mode'), kwargs.get('page_size'),
+                                kwargs.get('hedge'), kwargs.get('hedge_percentile'))
+    window_deadline = Deadline(kwargs.get('max_window_seconds') or WINDOW_DEADLINE_SECONDS, f"tramo {chunk_start}")
+
+    start_time_chunk = time.time()
+    logger.info(f"[CHUNK] --- {entity} tramo #{window['window_index']}: {chunk_start} a {chunk_end} ---")
+    pages, success = extractor.fetch_window(chunk_start, chunk_end, window_deadline)
+    if not success:
+        raise Exception(f"[CHUNK-FAIL] {entity} tramo {chunk_start} falló después de {MAX_RETRIES} reintentos.")
+
+    records = extractor.build_records(pages, chunk_start, chunk_end)
+    if not records:
+        logger.warning(f"[VOLUMETRY] ALERTA: Tramo {chunk_start} a {chunk_end} retornó 0 registros.")
+    logger.info(f"[METRICS] Tramo Finalizado: "
+                f"Páginas: {len(pages)} | "
+                f"Registros: {len(records)} | "
+                f"Duración: {round(time.time() - start_time_chunk, 2)}s")
+
+    df = records.to_frame()
+    if not df.empty:
+        df = df.assign(entity=entity)
+        df.attrs['last_checkpoint'] = chunk_end
+        df.attrs['pipeline_failed'] = False
+    return df
+
+
+def extract_entities(entity_names, client=None, **kwargs):
+    """
+    Extrae varias entidades en paralelo dentro del mismo proceso, compartiendo
+    sesión HTTP y caché de tokens. Devuelve un único DataFrame con columna `entity`.
+    """
+    logger = kwargs.get('logger')
+    if client is None:
+        client = QboClient(load_qbo_settings(), logger)
+    logger.info(f"[CONFIG] Extracción multi-entidad: {', '.join(entity_names)}")
+
+    with ThreadPoolExecutor(max_workers=len(entity_names)) as executor:
+        futures = {entity: executor.submit(extract_entity, entity, client, **kwargs) for entity in entity_names}
+        results = {entity: future.result() for entity, future in futures.items()}
+
+    frames = []
+    checkpoints = {}
+    dead_letters = {}
+    succeeded_windows = []
+    pipeline_failed = False
+    for entity, df_entity in results.items():
+        if df_entity.empty:
+            continue
+        if not df_entity.attrs.get('dry_run'):
+            checkpoints[entity] = df_entity.attrs.get('last_checkpoint')
+            if df_entity.attrs.get('dead_letters'):
+                dead_letters[entity] = df_entity.attrs['dead_letters']
+            succeeded_windows.extend(df_entity.attrs.get('succeeded_windows', []))
+            pipeline_failed = pipeline_failed or df_entity.attrs.get('pipeline_failed', False)
+        frames.append(df_entity.assign(entity=entity))
+
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if not df.empty:
+        df.attrs['last_checkpoint'] = checkpoints
+        df.attrs['pipeline_failed'] = pipeline_failed
+        df.attrs['original_fecha_fin'] = kwargs.get('fecha_fin')
+        df.attrs['dead_letters'] = dead_letters
+        df.attrs['succeeded_windows'] = succeeded_windows
+    return df
@@ -0,0 +1,100 @@
+"""
+Lectura de páginas QBO conservando el JSON original de cada registro.
+
+En lugar de `response.json()` + `json.dumps(payload)` por fila, se recorre el
+arreglo `QueryResponse.<Entidad>` con `JSONDecoder.raw_decode` (en C) y se
+corta el texto original de cada registro. Del objeto decodificado solo se leen
+`Id` y `MetaData.LastUpdatedTime`; el payload viaja como texto hasta JSONB.
+
+`iter_raw_records_stream` hace lo mismo sobre una respuesta en streaming: el
+generador solo retiene el registro en curso y el bloque recién leído; los
+registros que entrega quedan a cargo de quien los consume.
+"""
+import codecs
+import json
+import re
+
+_decoder = json.JSONDecoder()
+_separator = re.compile(r'[\s,]*')
+_query_response = re.compile(r'"QueryResponse"\s*:\s*\{')
+
+
+def iter_raw_records(body, entity):
+    """Genera (id, last_updated_time, json_text) por cada registro de la página."""
+    match = _query_response.search(body)
+    if match is None:
+        raise ValueError("[PARSE] Respuesta sin 'QueryResponse'.")
+    array = re.compile(rf'"{entity}"\s*:\s*\[').search(body, match.end())
+    if array is None:
+        return  # Página vacía: QBO omite la clave de la entidad
+
+    position = array.end()
+    while True:
+        position = _separator.match(body, position).end()
+        if body[position] == ']':
+            return
+        record, end = _decoder.raw_decode(body, position)
+        yield (record.get('Id'), record.get('MetaData', {}).get('LastUpdatedTime', ''), body[position:end])
+        position = end
+
+
+class _StreamBuffer:
+    """Texto decodificado de una respuesta en streaming, leído bajo demanda."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.finished = False
+
+    def read_more(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.text += self.decoder.decode(b'', final=True)
+            self.finished = True
+        elif chunk:
+            self.text += self.decoder.decode(chunk)
+
+    def truncated(self):
+        return ValueError("[PARSE] Respuesta incompleta: el stream terminó dentro del arreglo de registros.")
+
+
+def iter_raw_records_stream(chunks, entity):
+    """Igual que `iter_raw_records`, pero consume los bloques de bytes a medida que llegan."""
+    buffer = _StreamBuffer(chunks)
+    array_pattern = re.compile(rf'"{entity}"\s*:\s*\[')
+
+    # Inicio del arreglo de la entidad (o fin del cuerpo si la página viene vacía)
+    while True:
+        match = _query_response.search(buffer.text)
+        array = array_pattern.search(buffer.text, match.end()) if match else None
+        if array is not None:
+            break
+        if buffer.finished:
+            if match is None:
+                raise ValueError("[PARSE] Respuesta sin 'QueryResponse'.")
+            return
+        buffer.read_more()
+
+    position = array.end()
+    while True:
+        position = _separator.match(buffer.text, position).end()
+        if position >= len(buffer.text):
+            if buffer.finished:
+                raise buffer.truncated()
+            buffer.read_more()
+            continue
+        if buffer.text[position] == ']':
+            return
+        try:
+            record, end = _decoder.raw_decode(buffer.text, position)
+        except json.JSONDecodeError:
+            # Registro cortado entre bloques: leer más y reintentar
+            if buffer.finished:
+                raise buffer.truncated()
+            buffer.read_more()
+            continue
+        yield (record.get('Id'), record.get('MetaData', {}).get('LastUpdatedTime', ''), buffer.text[position:end])
+        # Se descarta lo ya procesado para no retener la página completa
+        buffer.text = buffer.text[end:]
+        position = 0
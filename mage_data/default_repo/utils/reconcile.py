@@ -0,0 +1,170 @@
+"""
+Conciliación por tramos entre QBO y la capa RAW. Para cada tramo de
+`LastUpdatedTime` se compara el COUNT(*) de QBO con las filas de
+`raw.qb_<entidad>` cuyo `source_last_updated_utc` cae en el tramo, y solo los
+tramos que no coinciden se vuelven a extraer. Verificar un backfill cuesta una
+consulta barata por tramo en vez de repetir el rango completo.
+
+Los COUNT(*) de una entidad corren en paralelo (`RECONCILE_CONCURRENCY`) sobre
+el pacer y los circuit breakers del cliente, así que respetan el mismo
+presupuesto de peticiones que la extracción.
+"""
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from default_repo.utils.circuit import CircuitOpenError
+from default_repo.utils.config import load_db_params, load_qbo_settings
+from default_repo.utils.dead_letter import record_dead_letters
+from default_repo.utils.entities import get_entity_config
+from default_repo.utils.pg_load import SCHEMA_NAME, export_entity, get_db_connection_with_retry
+from default_repo.utils.planner import WINDOW_FORMAT
+from default_repo.utils.qbo_extract import (WINDOW_DEADLINE_SECONDS, EntityExtractor, QboClient, extract_window,
+                                            plan_windows)
+from default_repo.utils.timeouts import Deadline, DeadlineExceeded
+
+RECONCILE_CONCURRENCY = 4   # COUNT(*) simultáneos por entidad (QBO admite 10)
+
+# Estado de cada tramo en el reporte
+MATCH = 'match'                     # Mismo conteo en QBO y RAW
+MISMATCH = 'mismatch'               # Difieren; pendiente de re-extraer
+COUNT_FAILED = 'count_failed'       # QBO no respondió el COUNT(*)
+REPAIRED = 'repaired'               # Re-extraído y ahora coincide
+PERSISTENT = 'persistent'           # Re-extraído y sigue difiriendo (ej: registros eliminados en QBO)
+REFETCH_FAILED = 'refetch_failed'   # La re-extracción falló (queda en dead letters)
+
+
+def count_raw_windows(entity, realm_id, windows, logger, db_params=None):
+    """
+    {inicio_de_tramo: filas} de la tabla RAW del realm, agrupadas por tramo de
+    `source_last_updated_utc` con una sola consulta. Los tramos de una entidad
+    están alineados a `chunk_days`, así que `date_bin` devuelve su inicio.
+    """
+    table = f"{SCHEMA_NAME}.{get_entity_config(entity)['table']}"
+    chunk_days = get_entity_config(entity)['chunk_days']
+    origin = windows[0]['extract_window_start_utc']
+    end = windows[-1]['extract_window_end_utc']
+    conn = get_db_connection_with_retry(db_params or load_db_params(), logger)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass(%s);", (table,))
+        if cur.fetchone()[0] is None:
+            return {}
+        cur.execute(f"""
+            SELECT date_bin(make_interval(days => %s), source_last_updated_utc, %s::timestamptz), COUNT(*)
+            FROM {table}
+            WHERE realm_id = %s AND source_last_updated_utc >= %s AND source_last_updated_utc < %s
+            GROUP BY 1;
+        """, (chunk_days, origin, realm_id, origin, end))
+        return {window_start.astimezone(timezone.utc).strftime(WINDOW_FORMAT): count
+                for window_start, count in cur.fetchall()}
+    finally:
+        conn.close()
+
+
+def compare_windows(entity_names, client=None, **kwargs):
+    """
+    Compara por tramo el COUNT(*) de QBO con las filas en RAW. Devuelve un
+    DataFrame con una fila por tramo: conteos y estado (`MATCH`, `MISMATCH`
+    o `COUNT_FAILED`). No escribe nada.
+    """
+    logger = kwargs.get('logger')
+    if client is None:
+        client = QboClient(load_qbo_settings(), logger)
+    windows = plan_windows(entity_names, **kwargs)
+    window_seconds = kwargs.get('max_window_seconds') or WINDOW_DEADLINE_SECONDS
+
+    rows = []
+    for entity in entity_names:
+        entity_windows = [window for window in windows if window['entity'] == entity]
+        extractor = EntityExtractor(entity, client, logger)
+        raw_counts = count_raw_windows(entity, client.realm_id, entity_windows, logger)
+
+        def count_qbo(window):
+            chunk_start = window['extract_window_start_utc']
+            try:
+                return extractor.count_window(chunk_start, window['extract_window_end_utc'],
+                                              Deadline(window_seconds, f"conteo {chunk_start}"))
+            except DeadlineExceeded as e:
+                logger.warning(f"[RECONCILE] {entity} tramo {chunk_start}: {str(e)}")
+                return None
+
+        # CircuitOpenError se propaga: con QBO caído no tiene sentido seguir contando
+        with ThreadPoolExecutor(max_workers=min(RECONCILE_CONCURRENCY, len(entity_windows))) as executor:
+            qbo_counts = list(executor.map(count_qbo, entity_windows))
+
+        for window, qbo_count in zip(entity_windows, qbo_counts):
+            raw_count = raw_counts.get(window['extract_window_start_utc'], 0)
+            if qbo_count is None:
+                status = COUNT_FAILED
+            else:
+                status = MATCH if qbo_count == raw_count else MISMATCH
+            rows.append(dict(window, realm_id=client.realm_id, qbo_count=qbo_count, raw_count=raw_count,
+                             status=status))
+            if status == MISMATCH:
+                logger.warning(f"[RECONCILE] {entity} tramo [{window['extract_window_start_utc']} - "
+                               f"{window['extract_window_end_utc']}]: QBO {qbo_count} | RAW {raw_count}")
+
+        statuses = [row['status'] for row in rows if row['entity'] == entity]
+        logger.info(f"[RECONCILE] {entity}: {len(entity_windows)} tramos | Coinciden: {statuses.count(MATCH)} | "
+                    f"Difieren: {statuses.count(MISMATCH)} | Sin conteo: {statuses.count(COUNT_FAILED)}")
+
+    return pd.DataFrame(rows)
+
+
+def refetch_mismatches(report, client=None, **kwargs):
+    """
+    Re-extrae y carga los tramos `MISMATCH` del reporte de `compare_windows` y
+    vuelve a contar RAW. Actualiza el estado (`REPAIRED`, `PERSISTENT` o
+    `REFETCH_FAILED`) y `raw_count_after`. Los tramos que fallan quedan en
+    dead letters.
+    """
+    logger = kwargs.get('logger')
+    report = report.copy()
+    if report.empty or not (report['status'] == MISMATCH).any():
+        logger.info("[RECONCILE] Ningún tramo por re-extraer.")
+        return report
+    if client is None:
+        client = QboClient(load_qbo_settings(), logger)
+    db_params = load_db_params()
+    report['raw_count_after'] = report['raw_count']
+
+    for entity, pending in report[report['status'] == MISMATCH].groupby('entity', sort=False):
+        logger.info(f"[RECONCILE] {entity}: re-extrayendo {len(pending)} tramos que difieren.")
+        failed = []
+        succeeded = []
+        for index, row in pending.iterrows():
+            window = {key: row[key] for key in ('entity', 'window_index', 'extract_window_start_utc',
+                                                 'extract_window_end_utc')}
+            try:
+                df = extract_window(window, client=client, logger=logger, fetch_mode=kwargs.get('fetch_mode'),
+                                    page_size=kwargs.get('page_size'),
+                                    max_window_seconds=kwargs.get('max_window_seconds'))
+                if not df.empty:
+                    export_entity(df.drop(columns=['entity']), entity, logger, db_params)
+                succeeded.append((window['extract_window_start_utc'], window['extract_window_end_utc']))
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                logger.error(f"[RECONCILE] {entity} tramo {window['extract_window_start_utc']} no se pudo "
+                             f"re-extraer: {str(e)}")
+                report.at[index, 'status'] = REFETCH_FAILED
+                failed.append(dict(window, error=str(e), attempts=1))
+
+        refetched = report.loc[pending.index]
+        refetched = refetched[refetched['status'] == MISMATCH]
+        if not refetched.empty:
+            raw_counts = count_raw_windows(entity, client.realm_id, refetched.to_dict('records'), logger, db_params)
+            for index, row in refetched.iterrows():
+                raw_count = raw_counts.get(row['extract_window_start_utc'], 0)
+                report.at[index, 'raw_count_after'] = raw_count
+                report.at[index, 'status'] = REPAIRED if raw_count == row['qbo_count'] else PERSISTENT
+                if raw_count != row['qbo_count']:
+                    logger.warning(f"[RECONCILE] {entity} tramo {row['extract_window_start_utc']} sigue difiriendo "
+                                   f"tras re-extraer: QBO {row['qbo_count']} | RAW {raw_count}. Revisar registros "
+                                   f"eliminados en QBO o modificados durante la conciliación.")
+        record_dead_letters(entity, client.realm_id, failed, succeeded, logger)
+
+    statuses = report['status'].value_counts()
+    logger.info(f"[RECONCILE] Re-extracción: Reparados: {statuses.get(REPAIRED, 0)} | "
+                f"Persistentes: {statuses.get(PERSISTENT, 0)} | Fallidos: {statuses.get(REFETCH_FAILED, 0)}")
+    return report
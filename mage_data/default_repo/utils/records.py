@@ -0,0 +1,74 @@
+"""
+Representación compacta de los registros extraídos. Los metadatos que son de
+la página (query, tramo, page_number, page_size, ingested_at) se guardan una
+sola vez por página junto con su cantidad de registros; por registro solo se
+guardan id, LastUpdatedTime y payload.
+"""
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+
+PAGE_COLUMNS = ['realm_id', 'ingested_at_utc', 'extract_window_start_utc', 'extract_window_end_utc',
+                'page_number', 'page_size', 'request_payload']
+CATEGORY_COLUMNS = ['realm_id', 'extract_window_start_utc', 'extract_window_end_utc', 'request_payload']
+RECORD_COLUMNS = ['realm_id', 'id', 'payload', 'ingested_at_utc', 'extract_window_start_utc',
+                  'extract_window_end_utc', 'page_number', 'page_size', 'request_payload',
+                  'source_last_updated_utc']
+
+
+class RecordBatch:
+    """Registros en columnas con una tabla de páginas. Se acumula con `extend` como una lista."""
+
+    def __init__(self):
+        self.pages = []
+        self.page_counts = []
+        self.ids = []
+        self.source_updated = []
+        self.payloads = []
+
+    def add_page(self, page, records):
+        """`page` es un dict con PAGE_COLUMNS (sin ingested_at_utc); `records` son (id, last_updated, payload)."""
+        page = dict(page, ingested_at_utc=page.get('ingested_at_utc') or datetime.now(timezone.utc))
+        self.pages.append(page)
+        self.page_counts.append(len(records))
+        for record_id, last_updated, payload in records:
+            self.ids.append(record_id)
+            self.source_updated.append(last_updated)
+            self.payloads.append(payload)
+
+    def extend(self, other):
+        self.pages.extend(other.pages)
+        self.page_counts.extend(other.page_counts)
+        self.ids.extend(other.ids)
+        self.source_updated.extend(other.source_updated)
+        self.payloads.extend(other.payloads)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def iter_pages(self):
+        """Genera (página, [(id, last_updated, payload), ...]) en orden."""
+        start = 0
+        for page, count in zip(self.pages, self.page_counts):
+            end = start + count
+            yield page, list(zip(self.ids[start:end], self.source_updated[start:end], self.payloads[start:end]))
+            start = end
+
+    def to_frame(self):
+        if not self.ids:
+            return pd.DataFrame()
+        codes = np.repeat(np.arange(len(self.pages), dtype=np.int32), self.page_counts)
+        pages = pd.DataFrame(self.pages, columns=PAGE_COLUMNS)
+        columns = {
+            'id': self.ids,
+            'payload': self.payloads,
+            'source_last_updated_utc': self.source_updated,
+            'ingested_at_utc': pd.DatetimeIndex(pd.to_datetime(pages['ingested_at_utc'], utc=True)).take(codes),
+            'page_number': pages['page_number'].to_numpy(dtype=np.int32).take(codes),
+            'page_size': pages['page_size'].to_numpy(dtype=np.int32).take(codes),
+        }
+        for column in CATEGORY_COLUMNS:
+            # Categórica: cada valor distinto se guarda una vez y cada fila es un código entero
+            categories = pd.Categorical(pages[column])
+            columns[column] = pd.Categorical.from_codes(categories.codes.take(codes), categories.categories)
+        return pd.DataFrame(columns)[RECORD_COLUMNS]
@@ -0,0 +1,7 @@
+def parse_flag(value):
+    """Interpreta una variable de runtime de Mage como booleano ('true', '1', 'yes'...)."""
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'si', 'sí', 'on')
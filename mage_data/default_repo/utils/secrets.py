@@ -0,0 +1,184 @@
+"""
+Acceso a secretos. Dentro de Mage se leen de Mage Secrets; fuera de Mage (CLI)
+se pueden cargar desde un archivo o desde variables de entorno, que tienen
+prioridad sobre Mage.
+
+Los valores de Mage Secrets se guardan en caché por proceso durante
+`SECRET_TTL_SECONDS`: un bloque, un hijo dinámico o un worker no vuelven a
+consultar la base de Mage por cada secreto. Un secreto editado en la UI se ve
+como máximo tras el TTL.
+
+`compare_and_set_secret` escribe un secreto solo si su valor actual es el
+esperado (compare-and-swap). Se usa para persistir los refresh tokens que QBO
+rota, sin pisar un valor que otro proceso ya actualizó.
+"""
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+
+SECRET_TTL_SECONDS = 300   # Vigencia de un secreto de Mage en la caché del proceso
+
+_overrides = {}
+_files = {}  # Secreto -> archivo del que se cargó (para escribirlo de vuelta)
+_cache = {}  # Secreto -> (valor, instante de expiración)
+_lock = threading.Lock()
+
+
+def _parse_secrets(content, path):
+    if path.endswith('.json'):
+        return {key: str(value) for key, value in json.loads(content).items()}
+    values = {}
+    for line in content.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#') or '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        values[key.strip()] = value.strip().strip('"').strip("'")
+    return values
+
+
+def load_secrets_file(path):
+    """Carga secretos desde un archivo JSON ({"QBO_CLIENT_ID": ...}) o .env (CLAVE=valor)."""
+    path = os.path.abspath(path)
+    with open(path) as f:
+        values = _parse_secrets(f.read(), path)
+    _overrides.update(values)
+    _files.update({key: path for key in values})
+    return len(values)
+
+
+def use_environment(prefix=''):
+    """Usa como secretos las variables de entorno (opcionalmente con prefijo, ej: 'QBO_SECRET_')."""
+    for key, value in os.environ.items():
+        if key.startswith(prefix):
+            _overrides[key[len(prefix):]] = value
+            _files.pop(key[len(prefix):], None)
+
+
+def get_overrides():
+    return {'values': dict(_overrides), 'files': dict(_files)}
+
+
+def set_overrides(overrides):
+    # Para procesos hijos lanzados con 'spawn', que no heredan el estado del módulo
+    _overrides.update(overrides['values'])
+    _files.update(overrides['files'])
+
+
+def _mage_secret_value(name):
+    from mage_ai.data_preparation.shared.secrets import get_secret_value as mage_secret_value
+    value = mage_secret_value(name)
+    if value is not None:
+        _cache[name] = (value, time.monotonic() + SECRET_TTL_SECONDS)
+    return value
+
+
+def get_secret_value(name):
+    if name in _overrides:
+        return _overrides[name]
+    cached = _cache.get(name)
+    if cached and time.monotonic() < cached[1]:
+        return cached[0]
+    return _mage_secret_value(name)
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def read_current_secret(name):
+    """Valor vigente en el almacén, no el leído al arrancar (otro proceso pudo cambiarlo)."""
+    if name in _files:
+        with open(_files[name]) as f:
+            value = _parse_secrets(f.read(), _files[name]).get(name)
+        _overrides[name] = value
+        return value
+    if name in _overrides:
+        return _overrides[name]
+    return _mage_secret_value(name)
+
+
+def compare_and_set_secret(name, expected, value):
+    """
+    Reemplaza el secreto `name` por `value` solo si hoy vale `expected`.
+    Devuelve False si otro proceso ya lo cambió. Escribe en el archivo de
+    secretos o en Mage Secrets. Un secreto que vino de variables de entorno no
+    se puede persistir: falla con ValueError en vez de guardarlo solo en memoria
+    y perderlo al reiniciar.
+    """
+    with _lock:
+        if name in _files:
+            written = _file_compare_and_set(_files[name], name, expected, value)
+        elif name in _overrides:
+            raise ValueError(f"[SECURITY] {name} viene de variables de entorno y no se puede persistir. "
+                             f"Usar --secrets-file o Mage Secrets para secretos que se rotan.")
+        else:
+            written = _mage_compare_and_set(name, expected, value)
+        if written and name in _overrides:
+            _overrides[name] = value
+        elif written:
+            _cache[name] = (value, time.monotonic() + SECRET_TTL_SECONDS)
+        return written
+
+
+def _file_compare_and_set(path, name, expected, value):
+    with open(path, 'r+') as f:
+        # El lock del archivo serializa a los procesos del CLI que comparten el mismo archivo
+        fcntl.flock(f, fcntl.LOCK_EX)
+        content = f.read()
+        if _parse_secrets(content, path).get(name) != expected:
+            return False
+        if path.endswith('.json'):
+            values = json.loads(content)
+            values[name] = value
+            content = json.dumps(values, indent=2) + '\n'
+        else:
+            content = re.sub(rf'^(\s*{re.escape(name)}\s*=).*$', lambda m: f"{m.group(1)}{value}",
+                             content, count=1, flags=re.MULTILINE)
+        f.seek(0)
+        f.write(content)
+        f.truncate()
+        return True
+
+
+def _mage_compare_and_set(name, expected, value):
+    # Mage guarda los secretos cifrados con Fernet y la llave global del proyecto
+    from cryptography.fernet import Fernet
+    from sqlalchemy import or_
+    from mage_ai.data_preparation.shared.secrets import get_secrets_dir
+    from mage_ai.orchestration.constants import Entity
+    from mage_ai.orchestration.db import db_connection
+    from mage_ai.orchestration.db.models.secrets import Secret
+    from mage_ai.settings.repo import get_repo_path
+
+    secrets_dir = get_secrets_dir(Entity.GLOBAL)
+    with open(os.path.join(secrets_dir, 'key')) as f:
+        fernet = Fernet(f.read().strip())
+    with open(os.path.join(secrets_dir, 'uuid')) as f:
+        key_uuid = f.read().strip()
+
+    db_connection.start_session()
+    session = db_connection.session
+    try:
+        # FOR UPDATE: dos escrituras concurrentes no pueden leer el mismo valor esperado.
+        # Otro proyecto de la misma instancia de Mage puede tener un secreto con el mismo nombre
+        secret = (session.query(Secret)
+                  .filter(Secret.name == name, Secret.repo_name == get_repo_path(),
+                          or_(Secret.key_uuid == key_uuid, Secret.key_uuid.is_(None)))
+                  .order_by(Secret.key_uuid.is_(None))
+                  .with_for_update()
+                  .first())
+        if secret is None:
+            raise ValueError(f"[SECURITY] {name} no existe en Mage Secrets.")
+        if fernet.decrypt(secret.value.encode('utf-8')).decode('utf-8') != expected:
+            session.rollback()
+            return False
+        secret.value = fernet.encrypt(value.encode('utf-8')).decode('utf-8')
+        session.commit()
+        return True
+    except Exception:
+        session.rollback()
+        raise
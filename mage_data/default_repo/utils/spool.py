@@ -0,0 +1,98 @@
+"""
+Spool en disco entre Loader y Exporter. El Loader escribe cada tramo en un
+archivo NDJSON a medida que lo extrae y entrega a Mage solo un manifiesto
+(ruta + conteo); el Exporter lee el archivo por lotes. Así el traspaso entre
+bloques no serializa cada payload.
+
+Formato: cada página abre con `#\t<metadatos de página JSON>` y le siguen sus
+registros como `<[id, LastUpdatedTime] JSON>\t<payload JSON>`. El payload se
+guarda como texto tal cual y llega así a la columna JSONB, sin volver a
+serializarse.
+"""
+import json
+import os
+import tempfile
+import uuid
+import pandas as pd
+from datetime import datetime
+from default_repo.utils.records import RecordBatch
+
+SPOOL_ENABLED = True
+SPOOL_DIR = os.environ.get('QBO_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'qbo_spool'))
+SPOOL_BATCH_SIZE = 5000       # Filas por lote al leer el spool
+SPOOL_COLUMN = 'spool_path'   # Columna que identifica un DataFrame manifiesto
+
+
+class SpoolWriter:
+    """Acumulador de registros con la misma interfaz que RecordBatch (`extend`, `len`)."""
+
+    def __init__(self, entity, realm_id, spool_dir=None):
+        spool_dir = spool_dir or SPOOL_DIR
+        self.realm_id = realm_id
+        os.makedirs(spool_dir, exist_ok=True)
+        self.path = os.path.join(spool_dir, f"{entity.lower()}_{realm_id}_{uuid.uuid4().hex}.ndjson")
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.count = 0
+
+    def extend(self, batch):
+        lines = []
+        for page, records in batch.iter_pages():
+            page = {key: (value.isoformat() if isinstance(value, datetime) else value) for key, value in page.items()}
+            lines.append(f"#\t{json.dumps(page, ensure_ascii=False)}\n")
+            for record_id, last_updated, payload in records:
+                if not isinstance(payload, str):
+                    payload = json.dumps(payload, ensure_ascii=False)
+                elif '\n' in payload:
+                    # JSON original con saltos de línea (pretty-print): se compacta para no romper el NDJSON
+                    payload = json.dumps(json.loads(payload), ensure_ascii=False)
+                lines.append(f"{json.dumps([record_id, last_updated])}\t{payload}\n")
+        self.file.writelines(lines)
+        self.file.flush()
+        self.count += len(batch)
+
+    def __len__(self):
+        return self.count
+
+    def manifest(self):
+        """DataFrame de una fila que Mage pasa al Exporter en lugar de los registros."""
+        self.file.close()
+        if self.count == 0:
+            remove_spool([self.path])
+            return pd.DataFrame()
+        return pd.DataFrame([{SPOOL_COLUMN: self.path, 'realm_id': self.realm_id, 'records': self.count}])
+
+
+def is_manifest(df):
+    return df is not None and SPOOL_COLUMN in df.columns
+
+
+def read_spool(paths, batch_size=SPOOL_BATCH_SIZE):
+    """Generador de DataFrames de hasta `batch_size` filas; `payload` queda como texto JSON."""
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            batch = RecordBatch()
+            page, records = None, []
+            for line in f:
+                head, body = line.rstrip('\n').split('\t', 1)
+                if head == '#':
+                    if page is not None:
+                        batch.add_page(page, records)
+                    page, records = json.loads(body), []
+                    continue
+                record_id, last_updated = json.loads(head)
+                records.append((record_id, last_updated, body))
+                if len(batch) + len(records) >= batch_size:
+                    # La página continúa en el siguiente lote con los mismos metadatos
+                    batch.add_page(page, records)
+                    yield batch.to_frame()
+                    batch, records = RecordBatch(), []
+            if page is not None and records:
+                batch.add_page(page, records)
+            if len(batch):
+                yield batch.to_frame()
+
+
+def remove_spool(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
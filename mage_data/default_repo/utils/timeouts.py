@@ -0,0 +1,121 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+
+class DeadlineExceeded(Exception):
+    """Se agotó el presupuesto de tiempo de un tramo o de la ejecución."""
+
+
+class Deadline:
+    """
+    Presupuesto de tiempo con límite opcional. Un Deadline hijo nunca vence
+    después que su padre, así el límite por tramo respeta el de la ejecución.
+    """
+
+    def __init__(self, seconds, label, parent=None):
+        self.label = label
+        self.parent = parent
+        self.expires_at = time.monotonic() + float(seconds) if seconds else None
+
+    def remaining(self):
+        candidates = []
+        if self.expires_at is not None:
+            candidates.append(self.expires_at - time.monotonic())
+        if self.parent is not None:
+            parent_remaining = self.parent.remaining()
+            if parent_remaining is not None:
+                candidates.append(parent_remaining)
+        return min(candidates) if candidates else None
+
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def check(self):
+        if self.expired():
+            exhausted = self
+            if self.parent is not None and self.parent.expired():
+                exhausted = self.parent
+            raise DeadlineExceeded(f"Deadline '{exhausted.label}' agotado")
+
+    def clamp_timeout(self, timeout):
+        """Recorta el timeout de lectura para no sobrepasar el presupuesto."""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        connect, read = timeout
+        return (min(connect, max(remaining, 0.1)), min(read, max(remaining, 0.1)))
+
+
+class LatencyTracker:
+    """Ventana deslizante de latencias para calcular percentiles."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self.samples.append(latency)
+
+    def percentile(self, pct):
+        with self._lock:
+            ordered = sorted(self.samples)
+        if len(ordered) < self.min_samples:
+            return None
+        index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+
+def hedged_get(url, hedge_after, logger=None, session=None, **request_kwargs):
+    """
+    GET idempotente con petición de respaldo: si la primera no responde en
+    `hedge_after` segundos se lanza una segunda idéntica y se usa la que
+    termine antes. Sin `hedge_after` equivale a un GET normal.
+    """
+    get = session.get if session is not None else requests.get
+    if not hedge_after:
+        return get(url, **request_kwargs)
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        primary = executor.submit(get, url, **request_kwargs)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        if logger:
+            logger.info(f"[HEDGE] Sin respuesta en {hedge_after:.2f}s, lanzando petición de respaldo.")
+        backup = executor.submit(get, url, **request_kwargs)
+        futures = (primary, backup)
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+                    continue
+                # La perdedora se cierra al terminar (o ya, si terminó junto con la ganadora)
+                for other in futures:
+                    if other is not future:
+                        other.add_done_callback(_close_response)
+                return response
+        raise error
+    finally:
+        # La petición perdedora termina sola, acotada por su propio timeout
+        executor.shutdown(wait=False)
+
+
+def _close_response(future):
+    # Una respuesta con stream=True que nadie lee retiene su conexión del pool
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
@@ -0,0 +1,155 @@
+"""
+Coordinación del token OAuth de QBO entre procesos (pipelines en paralelo,
+workers del CLI o de la cola). Todos comparten el refresh token de un realm y
+QBO lo rota al renovar: si dos procesos renuevan a la vez, el token que guarda
+uno deja de valer para el otro.
+
+Por eso solo un proceso a la vez es dueño del token de un realm: el que toma
+el lock de su fila en `raw.qb_token_state`. El dueño relee el refresh token
+vigente, renueva, persiste la rotación con compare-and-swap (utils/secrets.py)
+y publica el access token; los demás esperan el lock y reutilizan ese access
+token en vez de renovar. El refresh token nunca se guarda en esta tabla.
+
+El access token se guarda cifrado con Fernet, con una llave derivada del
+client secret de la app: quien solo puede leer `raw` no obtiene un token
+utilizable. La espera del lock tiene `lock_timeout`: si el dueño tarda (ej:
+OAuth caído y el circuit breaker esperando), los demás sueltan la espera,
+releen la fila sin lock y vuelven a intentar.
+"""
+import base64
+import hashlib
+import os
+import psycopg2
+import socket
+import time
+from default_repo.utils.config import load_db_params
+from default_repo.utils.pg_load import SCHEMA_NAME, get_db_connection_with_retry
+
+TOKEN_TABLE = f"{SCHEMA_NAME}.qb_token_state"
+TOKEN_MARGIN_SECONDS = 300       # Un access token compartido se descarta si le queda menos que esto
+TOKEN_LOCK_TIMEOUT_MS = 5000     # Espera por el lock de la fila antes de releerla sin lock
+TOKEN_WAIT_SECONDS = 1800        # Espera total por el dueño del token (igual que max_open_seconds del breaker)
+
+
+def ensure_token_table(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('raw_ddl'));")
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_NAME};")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TOKEN_TABLE} (
+            realm_id VARCHAR PRIMARY KEY,
+            access_token_encrypted TEXT,
+            expires_at TIMESTAMP WITH TIME ZONE,
+            owner VARCHAR,
+            updated_at_utc TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        );
+    """)
+    conn.commit()
+    cur.close()
+
+
+def token_cipher(client_secret):
+    """Fernet con llave derivada del client secret (SHA-256, 32 bytes en base64)."""
+    from cryptography.fernet import Fernet
+    return Fernet(base64.urlsafe_b64encode(hashlib.sha256(client_secret.encode('utf-8')).digest()))
+
+
+class TokenBroker:
+    """Access token de un realm compartido entre procesos a través de Postgres."""
+
+    def __init__(self, realm_id, client_secret, logger, db_params=None):
+        self.realm_id = realm_id
+        self.cipher = token_cipher(client_secret)
+        self.logger = logger
+        self.db_params = db_params
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._table_ready = False
+
+    def decrypt(self, encrypted):
+        from cryptography.fernet import InvalidToken
+        if not encrypted:
+            return None
+        try:
+            return self.cipher.decrypt(encrypted.encode('utf-8')).decode('utf-8')
+        except InvalidToken:
+            # Cifrado con otro client secret (ej: rotado): se renueva y se reemplaza
+            self.logger.warning(f"[AUTH-BROKER] Access token del realm {self.realm_id} no descifrable; "
+                                f"se renovará.")
+            return None
+
+    def shared_token(self, row, stale_token):
+        # (access_token, segundos_de_vida) si el publicado sigue vigente y no es el que falló
+        encrypted, owner, remaining = row
+        access_token = self.decrypt(encrypted)
+        if access_token and access_token != stale_token and remaining and remaining > TOKEN_MARGIN_SECONDS:
+            if owner != self.owner:
+                self.logger.info(f"[AUTH-BROKER] Access token del realm {self.realm_id} reutilizado "
+                                 f"(renovado por {owner}).")
+            return access_token, float(remaining) - TOKEN_MARGIN_SECONDS
+        return None
+
+    def get_access_token(self, renew, ttl, stale_token=None):
+        """
+        Devuelve (access_token, segundos_de_vida). Reutiliza el publicado por
+        otro proceso si sigue vigente y no es `stale_token`; si no, llama a
+        `renew()` con el lock de la fila tomado y publica el resultado. Si el
+        lock no se obtiene en `TOKEN_LOCK_TIMEOUT_MS`, relee la fila sin lock
+        y reintenta hasta `TOKEN_WAIT_SECONDS`.
+        """
+        if self.db_params is None:
+            self.db_params = load_db_params()
+        conn = get_db_connection_with_retry(self.db_params, self.logger)
+        try:
+            if not self._table_ready:
+                ensure_token_table(conn)
+                self._table_ready = True
+            cur = conn.cursor()
+            cur.execute(f"INSERT INTO {TOKEN_TABLE} (realm_id) VALUES (%s) ON CONFLICT (realm_id) DO NOTHING;",
+                        (self.realm_id,))
+            conn.commit()
+            select = f"""
+                SELECT access_token_encrypted, owner, EXTRACT(EPOCH FROM expires_at - now())
+                FROM {TOKEN_TABLE} WHERE realm_id = %s
+            """
+            wait_until = time.monotonic() + TOKEN_WAIT_SECONDS
+            while True:
+                cur.execute(f"SET LOCAL lock_timeout = {TOKEN_LOCK_TIMEOUT_MS};")
+                try:
+                    # El lock de la fila define al dueño: los demás procesos esperan aquí
+                    cur.execute(f"{select} FOR UPDATE;", (self.realm_id,))
+                    break
+                except psycopg2.errors.LockNotAvailable:
+                    conn.rollback()
+                # El dueño sigue renovando: puede que ya haya publicado un token
+                cur.execute(f"{select};", (self.realm_id,))
+                shared = self.shared_token(cur.fetchone(), stale_token)
+                conn.commit()
+                if shared:
+                    return shared
+                if time.monotonic() > wait_until:
+                    raise Exception(f"[AUTH-BROKER] El dueño del token del realm {self.realm_id} no lo publicó "
+                                    f"en {TOKEN_WAIT_SECONDS}s.")
+                self.logger.info(f"[AUTH-BROKER] Esperando al dueño del token del realm {self.realm_id}.")
+
+            shared = self.shared_token(cur.fetchone(), stale_token)
+            if shared:
+                conn.commit()
+                return shared
+
+            access_token = renew()
+            encrypted = self.cipher.encrypt(access_token.encode('utf-8')).decode('utf-8')
+            cur.execute(f"""
+                UPDATE {TOKEN_TABLE}
+                SET access_token_encrypted = %s, expires_at = now() + make_interval(secs => %s),
+                    owner = %s, updated_at_utc = now()
+                WHERE realm_id = %s;
+            """, (encrypted, ttl, self.owner, self.realm_id))
+            conn.commit()
+            self.logger.info(f"[AUTH-BROKER] Access token del realm {self.realm_id} renovado y publicado "
+                             f"por {self.owner}.")
+            return access_token, ttl
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
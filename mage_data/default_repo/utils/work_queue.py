@@ -0,0 +1,303 @@
+"""
+Cola de trabajo en Postgres para repartir un backfill entre varios workers
+(instancias de Mage o procesos en otros nodos). Cada fila es un tramo de una
+entidad y realm; los workers la reclaman con FOR UPDATE SKIP LOCKED y un lease
+que, si el worker muere, expira y devuelve el tramo a la cola. Mientras el
+worker trabaja un tramo, un heartbeat extiende el lease: un tramo lento no
+vuelve a la cola mientras su worker siga vivo.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+import pandas as pd
+from datetime import timezone
+from default_repo.utils.config import load_db_params, load_qbo_settings
+from default_repo.utils.multi_realm import load_realm_settings
+from default_repo.utils.pg_load import SCHEMA_NAME, export_entity, get_db_connection_with_retry
+from default_repo.utils.planner import WINDOW_FORMAT
+from default_repo.utils.qbo_extract import WINDOW_DEADLINE_SECONDS, QboClient, extract_window, plan_windows
+from default_repo.utils.runtime import parse_flag
+
+QUEUE_TABLE = f"{SCHEMA_NAME}.qb_backfill_queue"
+LEASE_SECONDS = 2 * WINDOW_DEADLINE_SECONDS   # Vigencia del lease sin heartbeat (worker caído)
+LEASE_HEARTBEAT_SECONDS = 60                  # Cada cuánto se extiende el lease del tramo en curso
+MAX_ATTEMPTS = 3                              # Intentos antes de marcar el tramo como 'failed'
+IDLE_POLL_SECONDS = 10                        # Espera cuando solo quedan tramos con lease vigente
+
+
+def ensure_queue_table(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('raw_ddl'));")
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_NAME};")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {QUEUE_TABLE} (
+            queue_id BIGSERIAL PRIMARY KEY,
+            entity VARCHAR NOT NULL,
+            realm_id VARCHAR NOT NULL,
+            extract_window_start_utc TIMESTAMP WITH TIME ZONE NOT NULL,
+            extract_window_end_utc TIMESTAMP WITH TIME ZONE NOT NULL,
+            state VARCHAR NOT NULL DEFAULT 'pending',  -- pending | running | done | failed
+            attempts INT NOT NULL DEFAULT 0,
+            lease_owner VARCHAR,
+            lease_expires_at TIMESTAMP WITH TIME ZONE,
+            records INT,
+            last_error TEXT,
+            updated_at_utc TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            UNIQUE (entity, realm_id, extract_window_start_utc, extract_window_end_utc)
+        );
+    """)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS qb_backfill_queue_state_idx ON {QUEUE_TABLE} (state, queue_id);")
+    conn.commit()
+    cur.close()
+
+
+def enqueue_windows(entity_names, realm_ids, **kwargs):
+    """
+    Encola los tramos del rango para cada realm. Es idempotente: los tramos ya
+    encolados (incluso los terminados) no se duplican, así que varias
+    instancias pueden lanzar el mismo trigger sin coordinarse.
+    """
+    logger = kwargs.get('logger')
+    windows = plan_windows(entity_names, **kwargs)
+    conn = get_db_connection_with_retry(load_db_params(), logger)
+    try:
+        ensure_queue_table(conn)
+        cur = conn.cursor()
+        inserted = 0
+        for realm_id in realm_ids:
+            for window in windows:
+                cur.execute(f"""
+                    INSERT INTO {QUEUE_TABLE} (entity, realm_id, extract_window_start_utc, extract_window_end_utc)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT DO NOTHING;
+                """, (window['entity'], realm_id, window['extract_window_start_utc'],
+                      window['extract_window_end_utc']))
+                inserted += cur.rowcount
+        conn.commit()
+        logger.info(f"[QUEUE] {inserted} tramos nuevos encolados "
+                    f"({len(windows) * len(realm_ids) - inserted} ya existían).")
+        return queue_status(conn)
+    finally:
+        conn.close()
+
+
+def queue_status(conn):
+    """Resumen de la cola por entidad, realm y estado."""
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT entity, realm_id, state, count(*) AS windows, coalesce(sum(records), 0) AS records
+        FROM {QUEUE_TABLE}
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3;
+    """)
+    df = pd.DataFrame(cur.fetchall(), columns=[column[0] for column in cur.description])
+    conn.commit()
+    cur.close()
+    return df
+
+
+def claim_window(conn, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Reclama el siguiente tramo pendiente (o con lease vencido). SKIP LOCKED
+    evita que dos workers esperen por la misma fila. Devuelve un dict o None.
+    """
+    cur = conn.cursor()
+    # Tramos de workers caídos que ya agotaron sus intentos
+    cur.execute(f"""
+        UPDATE {QUEUE_TABLE}
+        SET state = 'failed', last_error = coalesce(last_error, 'lease expirado'), updated_at_utc = now()
+        WHERE state = 'running' AND lease_expires_at < now() AND attempts >= %s;
+    """, (MAX_ATTEMPTS,))
+    cur.execute(f"""
+        UPDATE {QUEUE_TABLE} q
+        SET state = 'running',
+            attempts = q.attempts + 1,
+            lease_owner = %s,
+            lease_expires_at = now() + make_interval(secs => %s),
+            updated_at_utc = now()
+        WHERE q.queue_id = (
+            SELECT queue_id FROM {QUEUE_TABLE}
+            WHERE (state = 'pending' OR (state = 'running' AND lease_expires_at < now()))
+              AND attempts < %s
+            ORDER BY queue_id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING q.queue_id, q.entity, q.realm_id, q.extract_window_start_utc,
+                  q.extract_window_end_utc, q.attempts;
+    """, (worker_id, lease_seconds, MAX_ATTEMPTS))
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    if row is None:
+        return None
+    queue_id, entity, realm_id, window_start, window_end, attempts = row
+    return {
+        'queue_id': queue_id,
+        'entity': entity,
+        'realm_id': realm_id,
+        'window_index': queue_id,
+        'extract_window_start_utc': window_start.astimezone(timezone.utc).strftime(WINDOW_FORMAT),
+        'extract_window_end_utc': window_end.astimezone(timezone.utc).strftime(WINDOW_FORMAT),
+        'attempts': attempts,
+    }
+
+
+def finish_window(conn, window, worker_id, records=None, error=None):
+    """
+    Marca el tramo como 'done', o lo devuelve a 'pending' (o 'failed' si agotó
+    MAX_ATTEMPTS). Solo aplica si el worker aún es dueño del lease.
+    """
+    cur = conn.cursor()
+    if error is None:
+        cur.execute(f"""
+            UPDATE {QUEUE_TABLE}
+            SET state = 'done', records = %s, last_error = NULL, lease_owner = NULL,
+                lease_expires_at = NULL, updated_at_utc = now()
+            WHERE queue_id = %s AND lease_owner = %s;
+        """, (records, window['queue_id'], worker_id))
+    else:
+        cur.execute(f"""
+            UPDATE {QUEUE_TABLE}
+            SET state = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                last_error = %s, lease_owner = NULL, lease_expires_at = NULL, updated_at_utc = now()
+            WHERE queue_id = %s AND lease_owner = %s;
+        """, (MAX_ATTEMPTS, str(error)[:2000], window['queue_id'], worker_id))
+    owned = cur.rowcount == 1
+    conn.commit()
+    cur.close()
+    return owned
+
+
+def extend_lease(conn, window, worker_id, lease_seconds=LEASE_SECONDS):
+    """Renueva el lease del tramo. Devuelve False si el worker ya no es su dueño."""
+    cur = conn.cursor()
+    cur.execute(f"""
+        UPDATE {QUEUE_TABLE}
+        SET lease_expires_at = now() + make_interval(secs => %s), updated_at_utc = now()
+        WHERE queue_id = %s AND lease_owner = %s AND state = 'running';
+    """, (lease_seconds, window['queue_id'], worker_id))
+    owned = cur.rowcount == 1
+    conn.commit()
+    cur.close()
+    return owned
+
+
+class LeaseHeartbeat:
+    """
+    Hilo que extiende el lease de un tramo mientras se extrae y carga, con su
+    propia conexión (una conexión de psycopg2 no se comparte entre hilos).
+    """
+
+    def __init__(self, window, worker_id, lease_seconds, db_params, logger, interval=None):
+        self.window = window
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.db_params = db_params
+        self.logger = logger
+        self.interval = interval or min(LEASE_HEARTBEAT_SECONDS, lease_seconds / 3)
+        self.stopped = threading.Event()
+        self.lost = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        conn = None
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    if conn is None or conn.closed:
+                        conn = get_db_connection_with_retry(self.db_params, self.logger)
+                    if not extend_lease(conn, self.window, self.worker_id, self.lease_seconds):
+                        self.lost = True
+                        self.logger.warning(f"[QUEUE] {self.worker_id} perdió el lease de "
+                                            f"#{self.window['queue_id']}.")
+                        return
+                except Exception as e:
+                    # Un corte puntual no pierde el lease: se reintenta en el siguiente latido
+                    self.logger.warning(f"[QUEUE] No se pudo extender el lease de #{self.window['queue_id']}: "
+                                        f"{str(e)}")
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def has_open_leases(conn):
+    cur = conn.cursor()
+    cur.execute(f"SELECT 1 FROM {QUEUE_TABLE} WHERE state = 'running' LIMIT 1;")
+    running = cur.fetchone() is not None
+    conn.commit()
+    cur.close()
+    return running
+
+
+def run_worker(worker_id=None, max_windows=None, lease_seconds=LEASE_SECONDS, wait_for_leases=True, **kwargs):
+    """
+    Reclama, extrae, carga y cierra tramos hasta vaciar la cola. Con
+    `wait_for_leases` sigue esperando mientras otros workers tengan tramos en
+    curso, para recoger los que queden libres si alguno muere.
+    """
+    logger = kwargs.get('logger')
+    lease_seconds = int(lease_seconds)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    db_params = load_db_params()
+    conn = get_db_connection_with_retry(db_params, logger)
+    ensure_queue_table(conn)
+    logger.info(f"[QUEUE] Worker {worker_id} iniciado (lease: {lease_seconds}s).")
+
+    default_settings = load_qbo_settings()
+    clients = {}
+    processed = 0
+    failed = 0
+    try:
+        while max_windows is None or processed + failed < int(max_windows):
+            window = claim_window(conn, worker_id, lease_seconds)
+            if window is None:
+                if parse_flag(wait_for_leases) and has_open_leases(conn):
+                    time.sleep(IDLE_POLL_SECONDS)
+                    continue
+                break
+
+            realm_id = window['realm_id']
+            logger.info(f"[QUEUE] {worker_id} reclamó #{window['queue_id']}: {window['entity']} realm {realm_id} "
+                        f"[{window['extract_window_start_utc']} - {window['extract_window_end_utc']}] "
+                        f"(intento {window['attempts']}/{MAX_ATTEMPTS})")
+            try:
+                if realm_id not in clients:
+                    if realm_id == default_settings['realm_id']:
+                        settings = default_settings
+                    else:
+                        settings = load_realm_settings([{'realm_id': realm_id}])[0]
+                    clients[realm_id] = QboClient(settings, logger)
+
+                with LeaseHeartbeat(window, worker_id, lease_seconds, db_params, logger):
+                    df = extract_window(window, client=clients[realm_id], **kwargs)
+                    if not df.empty:
+                        export_entity(df.drop(columns=['entity']), window['entity'], logger, db_params)
+            except Exception as e:
+                failed += 1
+                logger.error(f"[QUEUE] Tramo #{window['queue_id']} falló: {str(e)}")
+                finish_window(conn, window, worker_id, error=e)
+                continue
+
+            processed += 1
+            if not finish_window(conn, window, worker_id, records=len(df)):
+                logger.warning(f"[QUEUE] El lease de #{window['queue_id']} expiró antes de terminar; "
+                               f"otro worker pudo reprocesarlo (el upsert es idempotente).")
+
+        logger.info(f"[QUEUE] Worker {worker_id} finalizado. Tramos completados: {processed} | Fallidos: {failed}")
+        return queue_status(conn)
+    finally:
+        conn.close()
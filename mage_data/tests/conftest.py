@@ -0,0 +1,28 @@
+"""
+Pruebas de las utilidades de default_repo. Se ejecutan desde `mage_data`:
+
+    python -m pytest -q tests
+
+Las pruebas contra Postgres usan `TEST_POSTGRES_DSN` (ej:
+`host=localhost dbname=postgres user=postgres`) y se omiten si no está definido.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def pg_conn():
+    dsn = os.environ.get('TEST_POSTGRES_DSN')
+    if not dsn:
+        pytest.skip("TEST_POSTGRES_DSN no definido")
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
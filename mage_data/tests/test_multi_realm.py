@@ -0,0 +1,42 @@
+import json
+import logging
+
+import pandas as pd
+
+from default_repo.utils import multi_realm
+
+
+def echo_options(settings, entity_names, options):
+    # Sustituye a _extract_realm: devuelve lo que recibió el proceso
+    df = pd.DataFrame([{'realm_id': settings['realm_id'], 'entity': entity_names[0],
+                        'options': json.dumps(options, sort_keys=True, default=str)}])
+    return df, {}
+
+
+def test_runtime_kwargs_reach_worker(monkeypatch):
+    monkeypatch.setattr(multi_realm, '_extract_realm', echo_options)
+    kwargs = {
+        'logger': logging.getLogger('test'),
+        'context': {'callback': lambda: None},
+        'fecha_inicio': '2024-01-01',
+        'repair_ids': '1,2,3',
+        'repair_table': 'raw.repair_ids',
+        'repair_batch_size': 50,
+        'page_size': 500,
+        'spool': True,
+        'spool_dir': '/tmp/spool',
+        'extract_mode': 'snapshot',
+        'snapshot_page_size': 1000,
+        'dead_letter_retry_seconds': 60,
+        'hedge': True,
+        'hedge_percentile': 90,
+    }
+    df = multi_realm.extract_realms([{'realm_id': '1'}, {'realm_id': '2'}], ['Invoice'], workers=2, **kwargs)
+
+    assert sorted(df['realm_id']) == ['1', '2']
+    for options in df['options']:
+        options = json.loads(options)
+        assert 'logger' not in options
+        assert 'context' not in options
+        expected = {key: value for key, value in kwargs.items() if key not in ('logger', 'context')}
+        assert options == expected
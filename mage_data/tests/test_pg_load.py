@@ -0,0 +1,113 @@
+import io
+import logging
+from datetime import datetime, timezone
+
+import psycopg2
+
+from default_repo.utils import pg_load
+from default_repo.utils.pg_load import RAW_COLUMNS, RawWriter, copy_to_staging, raw_upsert_sql
+
+
+class CapturingCursor:
+    def copy_expert(self, sql, buffer):
+        self.sql = sql
+        self.data = buffer.read()
+
+
+def raw_row(source_last_updated_utc):
+    ingested = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    return ('realm', '1', '{"Id": "1", "Note": "a,\\"b\\"\\nc"}', ingested, '2024-01-01T00:00:00+00:00',
+            '2024-01-02T00:00:00+00:00', 1, 10, 'SELECT * FROM Invoice', source_last_updated_utc)
+
+
+def test_copy_writes_none_as_null_marker():
+    cur = CapturingCursor()
+    copy_to_staging(cur, 'raw.staging', [raw_row(None)])
+    assert "NULL '\\N'" in cur.sql
+    fields = cur.data.rstrip('\n').split(',')
+    assert fields[-1] == '\\N'
+    assert fields[-4:-2] == ['1', '10']
+
+
+def test_copy_keeps_literal_null_marker_text_quoted():
+    cur = CapturingCursor()
+    copy_to_staging(cur, 'raw.staging', [raw_row(None)[:8] + ('\\N', None)])
+    assert cur.data.endswith('"\\N",\\N\n')
+
+
+class DroppingConnection:
+    """Conexión falsa: con `drop_after` se cae en esa sentencia y descarta lo no confirmado."""
+
+    def __init__(self, drop_after=None):
+        self.drop_after = drop_after
+        self.pending = []
+        self.committed = []
+        self.closed = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, values=None):
+        if self.drop_after is not None and len(self.pending) == self.drop_after:
+            self.pending = []
+            self.closed = 2
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        self.pending.append(values)
+
+    def commit(self):
+        self.committed.extend(self.pending)
+        self.pending = []
+
+    def close(self):
+        self.closed = 1
+
+
+def test_upsert_replays_batch_after_reconnect(monkeypatch):
+    monkeypatch.setattr(pg_load, 'DB_RETRY_BACKOFF', 0)
+    replacement = DroppingConnection()
+    monkeypatch.setattr(pg_load, 'get_db_connection_with_retry', lambda db_params, logger: replacement)
+    writer = RawWriter(DroppingConnection(drop_after=2), 'raw', 'qb_test', logging.getLogger('test'), None)
+    rows = [('realm', str(i)) for i in range(3)]
+
+    assert writer.write(rows) == 3
+    assert replacement.committed == rows
+    assert writer.rows_written == 3
+
+
+def create_raw_tables(cur):
+    cur.execute("CREATE TEMP TABLE qb_test (realm_id VARCHAR NOT NULL, id VARCHAR NOT NULL, payload JSONB, "
+                "ingested_at_utc TIMESTAMPTZ, extract_window_start_utc TIMESTAMPTZ, "
+                "extract_window_end_utc TIMESTAMPTZ, page_number INT, page_size INT, request_payload TEXT, "
+                "source_last_updated_utc TIMESTAMPTZ, payload_hash VARCHAR, PRIMARY KEY (realm_id, id));")
+    cur.execute("CREATE TEMP TABLE qb_test_bulk (LIKE qb_test);")
+
+
+def test_bulk_copy_loads_none_timestamp_like_insert(pg_conn):
+    cur = pg_conn.cursor()
+    create_raw_tables(cur)
+    rows = [raw_row(None), raw_row('2024-01-01T05:00:00+00:00')[:1] + ('2',) + raw_row(None)[2:9]
+            + ('2024-01-01T05:00:00+00:00',)]
+    copy_to_staging(cur, 'qb_test_bulk', rows)
+    cur.execute(raw_upsert_sql('pg_temp', 'qb_test', 'qb_test_bulk'))
+    cur.execute(f"SELECT {RAW_COLUMNS} FROM qb_test ORDER BY id;")
+    bulk = cur.fetchall()
+
+    cur.execute("TRUNCATE qb_test;")
+    for values in rows:
+        cur.execute(raw_upsert_sql('pg_temp', 'qb_test'), values)
+    cur.execute(f"SELECT {RAW_COLUMNS} FROM qb_test ORDER BY id;")
+    assert cur.fetchall() == bulk
+    assert bulk[0][9] is None
+    assert bulk[0][2] == {'Id': '1', 'Note': 'a,"b"\nc'}
+
+
+def test_payload_hash_ignores_text_formatting(pg_conn):
+    cur = pg_conn.cursor()
+    create_raw_tables(cur)
+    compact = raw_row(None)[:2] + ('{"Id":"1","Balance":10}',) + raw_row(None)[3:]
+    pretty = raw_row(None)[:1] + ('2', '{\n  "Balance": 10,\n  "Id": "1"\n}') + raw_row(None)[3:]
+    cur.execute(raw_upsert_sql('pg_temp', 'qb_test'), compact)
+    copy_to_staging(cur, 'qb_test_bulk', [pretty])
+    cur.execute(raw_upsert_sql('pg_temp', 'qb_test', 'qb_test_bulk'))
+    cur.execute("SELECT DISTINCT payload_hash FROM qb_test;")
+    assert len(cur.fetchall()) == 1
@@ -0,0 +1,20 @@
+from default_repo.utils.planner import estimate_plan
+
+WINDOWS = [('2024-01-01T00:00:00+00:00', '2024-01-02T00:00:00+00:00')]
+
+
+def plan(records, fetch_mode):
+    schedule, summary = estimate_plan(WINDOWS, {0: records}, 100, fetch_mode, 1, latency=0.1)
+    return schedule[0]['estimated_requests']
+
+
+def test_sequential_exact_multiple_needs_trailing_empty_page():
+    assert plan(200, 'sequential') == 3
+    assert plan(0, 'sequential') == 1
+    assert plan(250, 'sequential') == 3
+
+
+def test_count_first_full_last_page_adds_trailing_request():
+    assert plan(200, 'count_first') == 4
+    assert plan(250, 'count_first') == 4
+    assert plan(0, 'count_first') == 1
@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from default_repo.utils import entities, qbo_extract
+from default_repo.utils.qbo_extract import EntityExtractor, QboClient, TokenState
+from default_repo.utils.timeouts import Deadline
+
+SETTINGS = {
+    'realm_id': '1', 'base_url': 'https://qbo.test/v3/company', 'environment': 'sandbox',
+    'client_id': 'id', 'client_secret': 'secret', 'refresh_token': 'R0',
+}
+
+
+class HeadersResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, elapsed):
+        self.elapsed = timedelta(seconds=elapsed)
+
+    def json(self):
+        return {'QueryResponse': {}}
+
+    def close(self):
+        pass
+
+
+def test_concurrent_refresh_renews_once(monkeypatch):
+    # Todos los hilos vieron el token vencido en ensure_valid antes de que el primero renovara
+    tokens = TokenState('id', 'secret', 'R0', logging.getLogger('test'))
+    calls = []
+
+    def slow_renew():
+        calls.append(1)
+        time.sleep(0.2)
+        return f"TOKEN-{len(calls)}"
+
+    monkeypatch.setattr(tokens, 'renew', slow_renew)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(tokens.refresh())) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ['TOKEN-1'] * 5
+
+
+def test_refresh_of_stale_token_renews_again(monkeypatch):
+    tokens = TokenState('id', 'secret', 'R0', logging.getLogger('test'))
+    monkeypatch.setattr(tokens, 'renew', lambda: 'TOKEN-NEW')
+    tokens.access_token = 'TOKEN-OLD'
+    tokens.expires_at = time.monotonic() + 3600
+
+    assert tokens.refresh('TOKEN-OLD') == 'TOKEN-NEW'
+
+
+def make_extractor(monkeypatch, **kwargs):
+    monkeypatch.setattr(qbo_extract, 'TOKEN_BROKER_ENABLED', False)
+    client = QboClient(SETTINGS, logging.getLogger('test'))
+    client.tokens.access_token = 'TOKEN'
+    client.tokens.expires_at = time.monotonic() + 3600
+    monkeypatch.setattr(client.session, 'get', lambda url, **request_kwargs: HeadersResponse(0.05))
+    return EntityExtractor('Invoice', client, logging.getLogger('test'), **kwargs)
+
+
+def test_hedge_config_and_override(monkeypatch):
+    assert make_extractor(monkeypatch).hedge_percentile is None
+    assert make_extractor(monkeypatch, hedge='true').hedge_percentile == 95
+    assert make_extractor(monkeypatch, hedge=True, hedge_percentile='90').hedge_percentile == 90
+    monkeypatch.setitem(entities.ENTITIES, 'Invoice', {'table': 'qb_invoice', 'hedge': {'enabled': True}})
+    assert make_extractor(monkeypatch).hedge_percentile == 95
+    assert make_extractor(monkeypatch, hedge='false').hedge_percentile is None
+
+
+def test_latency_tracker_records_time_to_headers(monkeypatch):
+    extractor = make_extractor(monkeypatch)
+
+    def slow_parse(response):
+        time.sleep(0.2)
+        return []
+
+    extractor.run_query('SELECT * FROM Invoice', Deadline(None, 'test'), slow_parse)
+    assert list(extractor.latency_tracker.samples) == [0.05]
@@ -0,0 +1,25 @@
+import pytest
+
+from default_repo.utils import secrets
+
+
+@pytest.fixture(autouse=True)
+def clean_overrides(monkeypatch):
+    monkeypatch.setattr(secrets, '_overrides', {})
+    monkeypatch.setattr(secrets, '_files', {})
+
+
+def test_compare_and_set_rejects_environment_secret(monkeypatch):
+    monkeypatch.setenv('QBO_TEST_REFRESH_TOKEN', 'R0')
+    secrets.use_environment()
+    with pytest.raises(ValueError):
+        secrets.compare_and_set_secret('QBO_TEST_REFRESH_TOKEN', 'R0', 'R1')
+
+
+def test_compare_and_set_writes_secrets_file(tmp_path):
+    path = tmp_path / 'secrets.env'
+    path.write_text('QBO_REFRESH_TOKEN=R0\n')
+    secrets.load_secrets_file(str(path))
+    assert not secrets.compare_and_set_secret('QBO_REFRESH_TOKEN', 'otro', 'R1')
+    assert secrets.compare_and_set_secret('QBO_REFRESH_TOKEN', 'R0', 'R1')
+    assert path.read_text() == 'QBO_REFRESH_TOKEN=R1\n'
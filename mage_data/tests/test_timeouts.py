@@ -0,0 +1,48 @@
+import threading
+import time
+
+from default_repo.utils.timeouts import hedged_get
+
+
+class FakeResponse:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """El GET n-ésimo tarda `delays[n]` segundos."""
+
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.responses = []
+        self.lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self.lock:
+            index = len(self.responses)
+            response = FakeResponse(index)
+            self.responses.append(response)
+        time.sleep(self.delays[index])
+        return response
+
+
+def test_hedge_closes_late_losing_response():
+    session = FakeSession([0.3, 0.0])
+    response = hedged_get('https://qbo', 0.05, session=session, stream=True)
+    assert response.name == 1
+    time.sleep(0.4)
+    assert session.responses[0].closed
+    assert not response.closed
+
+
+def test_hedge_closes_loser_finished_with_winner():
+    session = FakeSession([0.2, 0.15])
+    response = hedged_get('https://qbo', 0.05, session=session, stream=True)
+    time.sleep(0.3)
+    loser = session.responses[1 - response.name]
+    assert loser.closed
+    assert not response.closed
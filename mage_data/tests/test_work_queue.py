@@ -0,0 +1,16 @@
+from default_repo.utils import work_queue
+
+
+def test_extend_lease_only_for_current_owner(pg_conn, monkeypatch):
+    monkeypatch.setattr(work_queue, 'QUEUE_TABLE', 'pg_temp.qb_backfill_queue')
+    cur = pg_conn.cursor()
+    cur.execute("CREATE TEMP TABLE qb_backfill_queue (queue_id INT PRIMARY KEY, state VARCHAR, "
+                "lease_owner VARCHAR, lease_expires_at TIMESTAMPTZ, updated_at_utc TIMESTAMPTZ);")
+    cur.execute("INSERT INTO qb_backfill_queue VALUES (1, 'running', 'w1', now() + interval '1 second', now());")
+    pg_conn.commit()
+    window = {'queue_id': 1}
+
+    assert work_queue.extend_lease(pg_conn, window, 'w1', 600)
+    cur.execute("SELECT lease_expires_at > now() + interval '500 seconds' FROM qb_backfill_queue;")
+    assert cur.fetchone()[0]
+    assert not work_queue.extend_lease(pg_conn, window, 'w2', 600)